@@ -10,9 +10,25 @@ lambda_markov_name = 'deepfake-bot-markovify'
 lambda_wordcloud_name = 'deepfake-bot-wordcloud'
 lambda_activity_name = 'deepfake-bot-activity'
 
+# Where data sets and other artifacts are kept: 's3', 'local' (a folder that stands in for S3 when testing) or 'memory'
+# (for tests and benchmarks that run everything in one process)
+artifact_store = os.environ.get('DEEPFAKE_ARTIFACT_STORE', 's3')
+local_artifact_path = os.environ.get('DEEPFAKE_LOCAL_ARTIFACT_PATH', './tmp/artifacts')
+
+# Where the lambda functions run: 'aws' or 'local' (a pool of worker processes on this machine, which needs the packages
+# in lambdas/requirements.txt)
+lambda_backend = os.environ.get('DEEPFAKE_LAMBDA_BACKEND', 'aws')
+local_lambda_workers = int(os.environ.get('DEEPFAKE_LOCAL_LAMBDA_WORKERS', 2))
+
 # Amazon RDS
 database_url = os.environ['DEEPFAKE_DATABASE_STRING']
 
+# Number of channels the extract task reads at the same time. Keep this small to stay under Discord's rate limits.
+extract_channel_concurrency = int(os.environ.get('DEEPFAKE_EXTRACT_CONCURRENCY', 4))
+
+# Number of extraction tasks that can run at once across all servers. Any more wait in a queue.
+max_extraction_jobs = int(os.environ.get('DEEPFAKE_MAX_EXTRACTION_JOBS', 3))
+
 # Need a unique delimiter to keep messages in flat text.
 unique_delimiter = '11a4b96a-ae8a-45f9-a4db-487cda63f5bd'
 
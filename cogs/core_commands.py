@@ -2,6 +2,7 @@ import logging
 import discord
 from discord.ext import commands
 from cogs import extract_task
+from cogs import extract_scheduler
 from cogs import db_queries
 from cogs.db_connection import DeepFakeBotConnectionError
 from cogs.config import *
@@ -14,7 +15,7 @@ class CoreCommands(commands.Cog):
         self.bot = bot
         self.session = None
         self.generate_subject = None
-        self.extraction_task_users = []
+        self.extraction_jobs = extract_scheduler.ExtractionScheduler()
 
     async def cog_check(self, ctx):
         """Refreshes the database connection and registers the user if not already done."""
@@ -37,6 +38,14 @@ class CoreCommands(commands.Cog):
         logger.info(self.bot.user.id)
         logger.info('------')
 
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        extract_task.member_names.discard(after.id)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        extract_task.member_names.discard(member.id)
+
     @commands.command(hidden=True)
     async def newsletter(self, ctx, msg):
         """Sends a DM to all registered users"""
@@ -67,20 +76,31 @@ class CoreCommands(commands.Cog):
         if success:
             await ctx.send('You will now receive newsletter messages.')
 
+    async def submit_extraction(self, ctx, coroutine):
+        """Hands an extraction task to the scheduler and lets the user know if it has to wait"""
+        try:
+            position = self.extraction_jobs.submit(ctx, coroutine)
+        except ValueError:
+            await ctx.send('Please wait until your other extraction task is complete.')
+            return
+
+        if position:
+            await ctx.send(f'I\'m busy with other extraction tasks right now. You are number {position} in the queue.')
+
     @commands.command()
     @commands.cooldown(5, 300, type=commands.BucketType.user)
     async def extract(self, ctx, *, subject: discord.Member = None):
         """Extracts chat history of a subject"""
         if subject:
-            if ctx.author.id in self.extraction_task_users:
+            if self.extraction_jobs.has_job(ctx.author.id):
                 await ctx.send('Please wait until your other extraction task is complete.')
             else:
                 db_queries.register_subject(self.session, ctx, subject)
                 await ctx.send(
                     f'Extracting chat history for {subject.name}...'
                 )
-                self.bot.loop.create_task(
-                    extract_task.extract_chat_history(ctx, subject, self.bot)
+                await self.submit_extraction(
+                    ctx, extract_task.extract_chat_history(ctx, subject, self.bot)
                 )
         else:
             await ctx.send('Usage: `df!extract <User#0000>`')
@@ -90,7 +110,7 @@ class CoreCommands(commands.Cog):
     async def generate(self, ctx, *, subject: discord.Member = None):
         """Runs all of the process steps needed to generate a model"""
         if subject:
-            if ctx.author.id in self.extraction_task_users:
+            if self.extraction_jobs.has_job(ctx.author.id):
                 await ctx.send('Please wait until your other extraction task is complete.')
             else:
                 db_queries.register_subject(self.session, ctx, subject)
@@ -98,12 +118,66 @@ class CoreCommands(commands.Cog):
                 await ctx.send(
                     f'Extracting chat history for {subject.name}...'
                 )
-                self.bot.loop.create_task(
-                    extract_task.extract_chat_history(ctx, subject, self.bot)
+                await self.submit_extraction(
+                    ctx, extract_task.extract_chat_history(ctx, subject, self.bot)
                 )
         else:
             await ctx.send('Usage: `df!generate <User#0000>`')
 
+    @commands.command()
+    @commands.cooldown(5, 300, type=commands.BucketType.user)
+    async def extractmany(self, ctx, *subjects: discord.Member):
+        """Extracts the chat history of several subjects while reading each channel only once"""
+        subjects = list({s.id: s for s in subjects}.values())
+        if subjects:
+            if self.extraction_jobs.has_job(ctx.author.id):
+                await ctx.send('Please wait until your other extraction task is complete.')
+            else:
+                for subject in subjects:
+                    db_queries.register_subject(self.session, ctx, subject)
+                subject_names = ', '.join(s.name for s in subjects)
+                await ctx.send(
+                    f'Extracting chat history for {subject_names}...'
+                )
+                await self.submit_extraction(
+                    ctx, extract_task.extract_chat_histories(
+                        ctx, [extract_task.SubjectExtraction(s) for s in subjects], self.bot)
+                )
+        else:
+            await ctx.send('Usage: `df!extractmany <User#0000> <User#0000> ...`')
+
+    @commands.command()
+    @commands.cooldown(5, 300, type=commands.BucketType.user)
+    async def refresh(self, ctx, *, subject: discord.Member = None):
+        """Adds a subject's newest messages to your latest data set"""
+        if subject:
+            if self.extraction_jobs.has_job(ctx.author.id):
+                await ctx.send('Please wait until your other extraction task is complete.')
+            else:
+                data_id = await db_queries.get_latest_dataset(self.session, ctx, subject)
+                if data_id:
+                    if db_queries.get_channel_checkpoints(self.session, data_id):
+                        await ctx.send(
+                            f'Extracting new chat history for {subject.name}...'
+                        )
+                        await self.submit_extraction(
+                            ctx, extract_task.extract_chat_history(ctx, subject, self.bot, data_id)
+                        )
+                    else:
+                        await ctx.send(f'Your latest data set for {subject.name} can\'t be refreshed. '
+                                       f'Try running `df!extract` again.')
+        else:
+            await ctx.send('Usage: `df!refresh <User#0000>`')
+
+    @commands.command()
+    @commands.cooldown(5, 60, type=commands.BucketType.user)
+    async def cancel(self, ctx):
+        """Cancels your extraction task"""
+        if self.extraction_jobs.cancel(ctx.author.id):
+            await ctx.send('Your extraction task has been cancelled.')
+        else:
+            await ctx.send('You don\'t have an extraction task running.')
+
     @commands.command()
     @commands.cooldown(2, 60, type=commands.BucketType.user)
     async def stats(self, ctx):
@@ -112,7 +186,8 @@ class CoreCommands(commands.Cog):
         result = 'Here are some stats about me:\n```'
         for k in stats.keys():
             result += f'{k}: {stats[k]}\n'
-        result += f'Extraction tasks in progress: {len(self.extraction_task_users)}'
+        for k, v in self.extraction_jobs.statistics().items():
+            result += f'{k}: {v}\n'
         result += '```'
 
         await ctx.send(result)
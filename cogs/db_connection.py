@@ -26,6 +26,7 @@ class ConnectionManager(commands.Cog):
         self.engine = create_engine(database_url, pool_pre_ping=True)
         self.conn = self.engine.connect()
         self.session = Session(self.engine)
+        cogs.db_queries.upgrade_tables(self.engine)
         cogs.db_queries.check_connection(self.session)
 
     def close_db_connection(self):
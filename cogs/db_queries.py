@@ -3,6 +3,8 @@ import discord
 from cogs.db_schema import *
 from cogs.config import *
 from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from sqlalchemy import distinct
@@ -10,6 +12,13 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Data sets and models older than this are treated as expired
+EXPIRY_DAYS = 30
+
+# Columns added to tables after they were first created. create_all only makes the tables that are missing, so these
+# are added to existing databases by upgrade_tables.
+ADDED_COLUMNS = [MarkovModel.__table__.c.cache_key, MarkovModel.__table__.c.time_used]
+
 
 def check_connection(session):
     """Should show a healthy connection when the bot starts"""
@@ -107,8 +116,8 @@ def register_subject(session, ctx, subject: discord.member):
         session.commit()
 
 
-def create_data_set(session, ctx, user_mention, uid):
-    """Adds a record for when a data set is created"""
+def create_data_set(session, ctx, user_mention, uid, checkpoints=None):
+    """Adds a record for when a data set is created. checkpoints maps each channel id to the newest message id read."""
     subject_id = session.query(Subject) \
                         .filter(Subject.discord_id == int(user_mention.id),
                                 Subject.server_id == int(ctx.message.guild.id),
@@ -121,9 +130,30 @@ def create_data_set(session, ctx, user_mention, uid):
         data_uid=uid
     )
     session.add(new_data_set)
+    session.flush()
+
+    if checkpoints:
+        for channel_id, last_message_id in checkpoints.items():
+            session.add(ChannelCheckpoint(
+                data_set_id=new_data_set.id,
+                channel_id=int(channel_id),
+                last_message_id=int(last_message_id)
+            ))
+
     session.commit()
 
 
+def get_channel_checkpoints(session, data_uid):
+    """Returns the newest message id read from each channel for a data set. Empty for data sets collected before
+    checkpoints were recorded."""
+    result = session.query(ChannelCheckpoint) \
+                    .join(DataSet) \
+                    .filter(DataSet.data_uid == data_uid) \
+                    .all()
+
+    return {r.channel_id: r.last_message_id for r in result}
+
+
 async def get_latest_dataset(session, ctx, user_mention):
     """Finds the most recent data set for a particular subject on a particular server. Returns False if no data found"""
     result = session.query(DataSet) \
@@ -135,7 +165,7 @@ async def get_latest_dataset(session, ctx, user_mention):
 
     try:
         data_set = result
-        if (dt.datetime.utcnow() - data_set.time_collected).days < 30:
+        if (dt.datetime.utcnow() - data_set.time_collected).days < EXPIRY_DAYS:
             return data_set.data_uid
         else:
             await ctx.message.channel.send(
@@ -298,34 +328,77 @@ def update_markov_settings(session, ctx, subject: discord.member, new_state_size
         session.commit()
 
 
-def create_markov_model(session, data_set_uid, model_uid):
+def create_markov_model(session, data_set_uid, model_uid, cache_key=None):
     """Adds a record for when a Markov model is generated"""
     data_set_id = session.query(DataSet) \
                          .filter(DataSet.data_uid == data_set_uid)\
                          .first().id
 
+    now = dt.datetime.utcnow()
     new_markov_model = MarkovModel(
         data_set_id=data_set_id,
-        time_collected=dt.datetime.utcnow(),
-        model_uid=model_uid
+        time_collected=now,
+        time_used=now,
+        model_uid=model_uid,
+        cache_key=cache_key
     )
     session.add(new_markov_model)
     session.commit()
 
 
-async def get_latest_markov_model(session, ctx, user_mention):
-    """Works similar to get_latest_dataset(). Returns False if no data found"""
+def find_cached_markov_model(session, cache_key):
+    """Returns the uid of the newest model generated with the same inputs as cache_key, or None if there isn't one
+    that has yet to expire. Expired models are evicted from the cache along the way."""
+    cutoff = dt.datetime.utcnow() - dt.timedelta(days=EXPIRY_DAYS)
+    session.query(MarkovModel) \
+           .filter(MarkovModel.cache_key == cache_key,
+                   MarkovModel.time_collected < cutoff) \
+           .update({MarkovModel.cache_key: None}, synchronize_session=False)
+    session.commit()
+
     result = session.query(MarkovModel) \
-                    .join(DataSet) \
-                    .join(Subject) \
-                    .filter(Subject.discord_id == int(user_mention.id),
-                            Subject.server_id == int(ctx.message.guild.id),
-                            Subject.trainer_id == int(ctx.message.author.id))\
+                    .filter(MarkovModel.cache_key == cache_key) \
                     .order_by(MarkovModel.id.desc()).first()
+    return result.model_uid if result else None
+
+
+def evict_cached_markov_model(session, model_uid):
+    """Stops a model from being reused, e.g. when its artifacts can no longer be found"""
+    session.query(MarkovModel) \
+           .filter(MarkovModel.model_uid == model_uid) \
+           .update({MarkovModel.cache_key: None}, synchronize_session=False)
+    session.commit()
+
+
+def use_markov_model(session, model_uid):
+    """Records that a model was reused from the cache, which makes it its subject's latest model. Its expiry still
+    goes by when it was generated."""
+    session.query(MarkovModel) \
+           .filter(MarkovModel.model_uid == model_uid) \
+           .update({MarkovModel.time_used: dt.datetime.utcnow()}, synchronize_session=False)
+    session.commit()
+
+
+def find_latest_markov_model(session, ctx, user_mention):
+    """Returns the most recently generated or reused Markov model record for a subject whether it has expired or not.
+    None if there isn't one."""
+    return session.query(MarkovModel) \
+                  .join(DataSet) \
+                  .join(Subject) \
+                  .filter(Subject.discord_id == int(user_mention.id),
+                          Subject.server_id == int(ctx.message.guild.id),
+                          Subject.trainer_id == int(ctx.message.author.id))\
+                  .order_by(func.coalesce(MarkovModel.time_used, MarkovModel.time_collected).desc(),
+                            MarkovModel.id.desc()).first()
+
+
+async def get_latest_markov_model(session, ctx, user_mention):
+    """Works similar to get_latest_dataset(). Returns False if no data found"""
+    result = find_latest_markov_model(session, ctx, user_mention)
 
     try:
         markov_model = result
-        if (dt.datetime.utcnow() - markov_model.time_collected).days < 30:
+        if (dt.datetime.utcnow() - markov_model.time_collected).days < EXPIRY_DAYS:
             return markov_model.model_uid
         else:
             await ctx.message.channel.send(
@@ -376,6 +449,24 @@ def create_deployment(session, ctx, model_uid, secret_key, bot_token=''):
     session.commit()
 
 
+def upgrade_tables(engine):
+    """Creates any missing tables and adds the columns in ADDED_COLUMNS to databases made before them"""
+    Base.metadata.create_all(engine)
+    inspector = inspect(engine)
+    for column in ADDED_COLUMNS:
+        table = column.table
+        if column.name in [c['name'] for c in inspector.get_columns(table.name)]:
+            continue
+
+        logger.info(f'Adding column {table.name}.{column.name}...')
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        for index in table.indexes:
+            if column.name in index.columns:
+                index.create(bind=engine)
+
+
 def make_tables():
     """Creates the tables in our database schema"""
     engine = create_engine(database_url)
@@ -38,6 +38,16 @@ class DataSet(Base):
     data_uid = Column(String(32), unique=True)
 
 
+class ChannelCheckpoint(Base):
+    """Newest message read from each channel when a data set was collected. Used to extract only newer messages."""
+    __tablename__ = 'channel_checkpoints'
+    id = Column(BigInteger, primary_key=True)
+    data_set_id = Column(BigInteger, ForeignKey('data_sets.id'))
+    data_set_foreign_key = relationship('DataSet', foreign_keys=[data_set_id])
+    channel_id = Column(BigInteger)
+    last_message_id = Column(BigInteger)
+
+
 class TextFilter(Base):
     """Text filters we apply to our data sets"""
     __tablename__ = 'filters'
@@ -68,6 +78,12 @@ class MarkovModel(Base):
     time_collected = Column(DateTime)
     model_uid = Column(String(32), unique=True)
 
+    # Hash of the data set and training settings the model was generated with, so it can be reused. See model_cache.py
+    cache_key = Column(String(64), index=True)
+
+    # When the model was last generated or reused from the cache. The subject's latest model is the one last used.
+    time_used = Column(DateTime)
+
 
 class Deployment(Base):
     """An encrypted markov chain model, that is either hosted by us or the user"""
@@ -1,9 +1,10 @@
 import discord
 from discord.ext import commands
 from cogs import db_queries
+from cogs import object_store
 import cogs.config
-import s3fs
 from cryptography.fernet import Fernet
+import asyncio
 import os
 import json
 import logging
@@ -16,8 +17,7 @@ class DeployCommands(commands.Cog):
         self.bot = bot
         self.parent_cog = self.bot.get_cog('CoreCommands')
         self.session = self.parent_cog.session
-        self.s3 = s3fs.S3FileSystem(key=cogs.config.aws_access_key_id,
-                                    secret=cogs.config.aws_secret_access_key)
+        self.store = object_store.get_object_store()
 
     async def cog_check(self, ctx):
         connection_ok = await self.parent_cog.cog_check(ctx)
@@ -28,8 +28,7 @@ class DeployCommands(commands.Cog):
         # Read from S3
         model_file_name = f'{model_uid}-markov-model.json.gz'
         encrypted_file_name = model_file_name.replace('markov-model', 'markov-model-encrypted')
-        with self.s3.open(f'{cogs.config.aws_s3_bucket_prefix}/{model_file_name}', mode='rb') as f:
-            content = f.read()
+        content = self.store.read(model_file_name)
 
         # Generate encryption key
         key = Fernet.generate_key()
@@ -54,7 +53,8 @@ class DeployCommands(commands.Cog):
         if model_uid:
 
             # Create and record an encrypted model
-            key, encrypted_file_name = self.download_and_encrypt(model_uid)
+            loop = asyncio.get_event_loop()
+            key, encrypted_file_name = await loop.run_in_executor(None, self.download_and_encrypt, model_uid)
             db_queries.create_deployment(self.session, ctx, model_uid, key.decode())
 
             # Create a config file with default settings
@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict, deque
+from cogs.config import *
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class ExtractionJob:
+    """A single user's extraction task"""
+    def __init__(self, ctx, coroutine):
+        self.ctx = ctx
+        self.user_id = ctx.author.id
+        self.guild_id = ctx.guild.id
+        self.coroutine = coroutine
+        self.state = QUEUED
+        self.task = None
+
+
+class ExtractionScheduler:
+    """Runs extraction jobs with a global limit on how many read chat history at once. Each user can only have one job.
+    Queued jobs are started round robin across servers so a burst of requests on one server can't hold up the rest."""
+    def __init__(self, max_running=max_extraction_jobs):
+        self.max_running = max_running
+        self.jobs = {}
+        self.queues = OrderedDict()
+        self.running = set()
+
+    def has_job(self, user_id):
+        return user_id in self.jobs
+
+    def submit(self, ctx, coroutine):
+        """Queues an extraction coroutine for the author of ctx. Returns the job's position in the queue or 0 if it
+        started straight away."""
+        if self.has_job(ctx.author.id):
+            coroutine.close()
+            raise ValueError('This user already has an extraction job')
+
+        job = ExtractionJob(ctx, coroutine)
+        self.jobs[job.user_id] = job
+        self.queues.setdefault(job.guild_id, deque()).append(job)
+        self.start_next()
+        return self.queue_position(job)
+
+    def queue_position(self, job):
+        """Position a queued job will be started in, counting from 1. 0 for jobs that aren't queued."""
+        if job.state != QUEUED:
+            return 0
+        queued = (j for j in itertools.chain(*itertools.zip_longest(*self.queues.values())) if j is not None)
+        for position, j in enumerate(queued, 1):
+            if j is job:
+                return position
+
+    def position(self, user_id):
+        return self.queue_position(self.jobs[user_id]) if user_id in self.jobs else 0
+
+    def start_next(self):
+        while self.queues and len(self.running) < self.max_running:
+            # Take from the server that has waited longest then send it to the back of the line
+            guild_id, queue = self.queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self.queues[guild_id] = queue
+
+            job.state = RUNNING
+            job.task = asyncio.get_event_loop().create_task(job.coroutine)
+            job.task.add_done_callback(lambda task, job=job: self.finished(job))
+            self.running.add(job)
+
+    def finished(self, job):
+        if job.task.cancelled():
+            job.state = CANCELLED
+        elif job.task.exception() is not None:
+            job.state = FAILED
+            logger.error(f'Extraction job failed: {job.task.exception()!r}')
+            asyncio.get_event_loop().create_task(
+                job.ctx.send(f'Sorry, your extraction task failed. You can report this here: {report_issue_url}')
+            )
+        else:
+            job.state = FINISHED
+
+        self.running.discard(job)
+        self.jobs.pop(job.user_id, None)
+        self.start_next()
+
+    def cancel(self, user_id):
+        """Cancels a user's job whether it's queued or running. Returns False if they don't have one."""
+        job = self.jobs.get(user_id)
+        if job is None:
+            return False
+
+        if job.state == QUEUED:
+            queue = self.queues[job.guild_id]
+            queue.remove(job)
+            if not queue:
+                del self.queues[job.guild_id]
+            job.coroutine.close()
+            job.state = CANCELLED
+            del self.jobs[user_id]
+        else:
+            job.task.cancel()
+
+        return True
+
+    def statistics(self):
+        return {
+            'Extraction tasks in progress': len(self.running),
+            'Extraction tasks queued': len(self.jobs) - len(self.running)
+        }
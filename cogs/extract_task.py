@@ -1,7 +1,12 @@
+import io
+import math
 import uuid
-import gzip
+import functools
+from array import array
 import datetime as dt
 from cogs import db_queries
+from cogs import object_store
+from lambdas.common import dataset
 import discord
 import logging
 import asyncio
@@ -13,140 +18,295 @@ MAX_CHANNEL_MESSAGES = 10**5
 # ...and the number of automatically added filters
 MAX_AUTO_FILTERS = 32
 
+# ...and the number of channels being read at once
+MAX_CONCURRENT_CHANNELS = extract_channel_concurrency
+
 logger = logging.getLogger(__name__)
 
 
-async def extract_chat_history(ctx, subject, bot):
-    """Background task for reading chat history and uploading to S3"""
-    await bot.wait_until_ready()
+class SubjectExtraction:
+    """Output file and counters for one subject of an extraction task. If previous_data_uid is given, only messages
+    newer than that data set's channel checkpoints are added to a copy of it."""
+    def __init__(self, subject, previous_data_uid=None):
+        self.subject = subject
+        self.previous_data_uid = previous_data_uid
+        self.extraction_id = str(uuid.uuid4().hex)
+        self.data_file_name = dataset.data_file_name(self.extraction_id)
+        self.data_upload = None
+        self.writer = None
+        self.auto_filters = CommandPrefixCounter()
+        self.message_counter = 0
+        self.checkpoints = {}
+
+    async def open(self, store, session):
+        """Starts streaming the subject's data set to the object store. For incremental extractions, the data set starts
+        as a copy of the previous one. Returns False if the previous data set can't be copied."""
+        self.writer = dataset.DataSetWriter()
+        self.data_upload = object_store.StreamingUpload(store, self.data_file_name)
+        await self.data_upload.start()
+        await self.data_upload.write(self.writer.header())
+
+        if not self.previous_data_uid:
+            return True
 
-    logger.info(f'Extracting chat history for {subject.name}...')
-    start_time = dt.datetime.now()
+        try:
+            loop = asyncio.get_event_loop()
+            previous = await loop.run_in_executor(None, dataset.load_data_set, self.previous_data_uid,
+                                                  functools.partial(object_store.read_object, store))
+            await self.data_upload.write(self.writer.encode(previous.messages()))
+            self.checkpoints = db_queries.get_channel_checkpoints(session, self.previous_data_uid)
+            return True
+        except Exception as e:
+            logger.error(str(e))
+            await self.data_upload.abort()
+            self.previous_data_uid = None
+            await self.open(store, session)
+            return False
+
+    async def write(self, channel, texts, timestamps):
+        """Adds a channel's messages to the data set"""
+        self.message_counter += len(texts)
+        await self.data_upload.write(self.writer.encode_channel(texts, timestamps, channel.name))
+
+    async def close(self):
+        await self.data_upload.write(self.writer.footer())
+        await self.data_upload.close()
+        self.data_upload = None
+
+    async def abort(self):
+        if self.data_upload is not None:
+            await self.data_upload.abort()
+            self.data_upload = None
+
+    async def attachments(self, store):
+        """Exports the uploaded data set in the delimited text format so it can be attached to a Discord message"""
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, object_store.read_object, store, self.data_file_name)
+        reader = dataset.DataSetReader(data)
+        text_file_name, channel_file_name = dataset.legacy_file_names(self.extraction_id)
+        files = [discord.File(io.BytesIO(dataset.export_text(reader)), filename=text_file_name),
+                 discord.File(io.BytesIO(dataset.export_channels(reader)), filename=channel_file_name)]
+        reader.close()
+        return files
+
+
+def can_read_history(channel, member):
+    """Works out from the cached permissions whether a member can read a channel's history. Returns None if it can't
+    be told that way."""
+    if member is None:
+        return None
+    try:
+        permissions = channel.permissions_for(member)
+        return permissions.read_messages and permissions.read_message_history
+    except Exception as e:
+        logger.error(str(e))
+        return None
+
+
+async def probe_channel(channel):
+    """Tries reading a message to see if a channel's history is readable. Returns None for errors other than 403."""
+    try:
+        async for message in channel.history(limit=1):
+            _ = message.content
+        return True
+    except Exception as e:
+        if str(e).startswith('403'):
+            return False
+        else:
+            logger.error(str(e))
+            return None
+
+
+async def find_accessible_channels(guild):
+    """Returns the text channels the bot can read and the names of those it can't. Channels are checked against the
+    bot's permissions and only probed if that doesn't settle it. Probes run at the same time."""
+    text_channels = list(filter(lambda x: hasattr(x, 'history'), guild.channels))
+    readable = [can_read_history(channel, guild.me) for channel in text_channels]
+
+    unclear = [i for i, r in enumerate(readable) if r is None]
+    probes = await asyncio.gather(*(probe_channel(text_channels[i]) for i in unclear))
+    for i, r in zip(unclear, probes):
+        readable[i] = r
+
+    accessible_channels = [c for c, r in zip(text_channels, readable) if r]
+    unreadable_channels = [c.name for c, r in zip(text_channels, readable) if r is False]
+    return accessible_channels, unreadable_channels
+
+
+async def read_channel_history(ctx, channel, subjects, bot, semaphore, after=None):
+    """Reads a single channel's history once for every subject. subjects maps each subject's id to the message id
+    after which their messages are wanted, or None to read everything. Returns each subject's message texts and
+    timestamps, the bot command prefixes counted in them and the newest message id read. If reading the history fails
+    part way through, a read after a message keeps what it read up to then, but a full read returns no messages and a
+    message id of None."""
+    contents = {subject_id: [] for subject_id in subjects}
+    timestamps = {subject_id: array('q') for subject_id in subjects}
+    channel_counter, last_message_id = 0, after
+    history_kwargs = {'after': discord.Object(id=after)} if after else {}
+
+    async with semaphore:
+        try:
+            logger.info(f'Processing channel: {channel.name} on {ctx.guild.name}')
+            start_time_channel = dt.datetime.now()
+            async for message in channel.history(limit=MAX_CHANNEL_MESSAGES, **history_kwargs):
+                channel_counter += 1
+                if not last_message_id or message.id > last_message_id:
+                    last_message_id = message.id
+                try:
+                    author_id = message.author.id
+                    if author_id in subjects and message.id > (subjects[author_id] or 0):
+                        contents[author_id].append(str(message.content))
+                        timestamps[author_id].append(int(message.created_at.timestamp()))
+
+                except Exception as e:
+                    logger.error(str(e))
+
+            end_time_channel = dt.datetime.now()
+            logger.info(f'{channel.name} processed in {end_time_channel - start_time_channel} seconds')
 
-    # Prevent the user from having more than one extraction task running at once
-    def block_extract_task():
-        bot.get_cog('CoreCommands').extraction_task_users.append(ctx.author.id)
+        except Exception as e:
+            logger.error(str(e))
+            if after is None:
+                # A full read goes newest first, so the messages older than the ones read are still missing. Drop
+                # what was read and leave the checkpoint as it was so the whole channel is read next time.
+                contents = {subject_id: [] for subject_id in subjects}
+                timestamps = {subject_id: array('q') for subject_id in subjects}
+                last_message_id = None
+            # A read after a message goes oldest first, so everything up to the newest message read is there
+
+    # Process text
+    texts, auto_filters = {}, {}
+    for subject_id in subjects:
+        texts[subject_id] = mentions_to_names_batch(contents[subject_id], bot)
+        auto_filters[subject_id] = CommandPrefixCounter()
+        auto_filters[subject_id].add_messages(texts[subject_id])
+
+    return texts, timestamps, auto_filters, last_message_id, channel_counter
+
+
+async def extract_chat_history(ctx, subject, bot, previous_data_uid=None):
+    """Background task for reading a subject's chat history and uploading it. If previous_data_uid is given, only
+    messages newer than that data set's channel checkpoints are read and appended to a copy of it."""
+    extraction = SubjectExtraction(subject, previous_data_uid)
+    await extract_chat_histories(ctx, [extraction], bot)
 
-    def release_extract_task():
-        bot.get_cog('CoreCommands').extraction_task_users.remove(ctx.author.id)
+    if ctx.invoked_with == 'generate':
+        # Start the next step in the process. It runs as its own task so the next extraction job can start.
+
+        await ctx.send('Starting task 2 of 4...')
+        plots_cog = bot.get_cog('PlotCommands')
+        await ctx.send('Activity plot request submitted...')
+        bot.loop.create_task(
+            plots_cog.process_activity(ctx, subject, extraction.extraction_id)
+        )
 
-    # Setup file names
-    extraction_id = str(uuid.uuid4().hex)
-    text_file_name = f'./tmp/{extraction_id}-text.dsv.gz'
-    channel_file_name = f'./tmp/{extraction_id}-channels.csv.gz'
 
-    # Setup initial parameters for our loop
-    timestamps, channel_names, accessible_channels, unreadable_channels, message_counter, auto_filters = \
-        [], [], [], [], 0, []
+async def extract_chat_histories(ctx, extractions, bot):
+    """Background task for reading the chat history of one or more subjects in a single pass over each channel. Each
+    subject gets its own data set."""
+    await bot.wait_until_ready()
+
+    subject_names = ', '.join(e.subject.name for e in extractions)
+    logger.info(f'Extracting chat history for {subject_names}...')
+    start_time = dt.datetime.now()
 
     # Determine the number of text channels and which ones the bot can read
-    readable_channels = list(filter(lambda x: hasattr(x, 'history'), ctx.message.guild.channels))
-    for channel in readable_channels:
-        try:
-            async for message in channel.history(limit=1):
-                _ = message.content
-            accessible_channels.append(channel)
-        except Exception as e:
-            if str(e).startswith('403'):
-                unreadable_channels.append(channel.name)
-            else:
-                logger.error(str(e))
+    accessible_channels, unreadable_channels = await find_accessible_channels(ctx.message.guild)
 
+    # Channels are read MAX_CONCURRENT_CHANNELS at a time, each taking up to about 3 minutes
+    minutes = math.ceil(len(accessible_channels) / MAX_CONCURRENT_CHANNELS) * 3
     msg = f'Found {len(accessible_channels)} text channels that I have permission to read. This task could take up to '\
-          f'{len(accessible_channels) * 3} minutes.'
+          f'{minutes} minutes.'
 
     bot.loop.create_task(
         ctx.send(msg)
     )
 
-    block_extract_task()
+    session = bot.get_cog('ConnectionManager').session
+    store = object_store.get_object_store()
+    channel_tasks = []
+    try:
+        for extraction in extractions:
+            if not await extraction.open(store, session):
+                bot.loop.create_task(
+                    ctx.send(f'I couldn\'t open your previous data set for {extraction.subject.name} so I\'ll have to '
+                             f'read everything again.')
+                )
 
-    # Open a text file and start looping through each channel messages
-    with gzip.open(text_file_name, 'wb') as f:
+        # Read several channels at once but write them out in the same order every time. A channel only needs to be
+        # read from the oldest checkpoint of all the subjects.
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHANNELS)
         for channel in accessible_channels:
-            channel_counter = 0
-            author_counter = 0
-            try:
-                logger.info(f'Processing channel: {channel.name} on {ctx.guild.name}')
-                start_time_channel = dt.datetime.now()
-                async for message in channel.history(limit=MAX_CHANNEL_MESSAGES):
-                    channel_counter += 1
-                    try:
-                        if message.author == subject:
-                            # Increment counters
-                            author_counter += 1
-                            message_counter += 1
-
-                            # Process text
-                            result = str(mentions_to_names(message.content, bot))
-                            prefix_check = likely_a_bot_command(result)
-                            if prefix_check: auto_filters.append(prefix_check)
-                            result += unique_delimiter
-
-                            # Add to channels data
-                            timestamps.append(int(message.created_at.timestamp()))
-                            channel_names.append(channel.name)
-
-                            # Write to flat text file
-                            f.write(result.encode())
-
-                    except Exception as e:
-                        logger.error(str(e))
-                        release_extract_task()
-
-                end_time_channel = dt.datetime.now()
-                logger.info(f'{channel.name} processed in {end_time_channel - start_time_channel} seconds')
-
-            except Exception as e:
-                logger.error(str(e))
-                release_extract_task()
-
-            if author_counter > 0:
-                msg = f'Found {author_counter} of {channel_counter} messages written by '\
-                      f'{subject.name} in `#{channel.name}`'
+            subjects = {e.subject.id: e.checkpoints.get(channel.id) for e in extractions}
+            after = None if None in subjects.values() else min(subjects.values())
+            channel_tasks.append(bot.loop.create_task(
+                read_channel_history(ctx, channel, subjects, bot, semaphore, after)
+            ))
+
+        # Write each channel's messages to the subjects' files as its task finishes. Parts are uploaded while the
+        # remaining channels are still being read.
+        for channel, channel_task in zip(accessible_channels, channel_tasks):
+            texts, timestamps, auto_filters, last_message_id, channel_counter = await channel_task
+
+            found_phrases = []
+            for extraction in extractions:
+                subject = extraction.subject
+                extraction.auto_filters.merge(auto_filters[subject.id])
+                await extraction.write(channel, texts[subject.id], timestamps[subject.id])
+                if last_message_id:
+                    checkpoint = extraction.checkpoints.get(channel.id) or 0
+                    extraction.checkpoints[channel.id] = max(last_message_id, checkpoint)
+                if texts[subject.id]:
+                    found_phrases.append(f'{len(texts[subject.id])} of {channel_counter} messages written by '
+                                         f'{subject.name}')
+
+            if found_phrases:
+                msg = f'Found {" and ".join(found_phrases)} in `#{channel.name}`'
                 logger.info(msg)
                 bot.loop.create_task(
                     ctx.send(msg)
                 )
 
-    # Allow the user to execute this command again
-    release_extract_task()
+        for extraction in extractions:
+            await extraction.close()
 
-    with gzip.open(channel_file_name, 'wb') as f:
-        f.write('timestamp,channel\n'.encode())
-        for i in range(len(channel_names)):
-            f.write(f'{timestamps[i]},{channel_names[i]}\n'.encode())
+    except BaseException:
+        # Cancelled or failed part way through. Don't leave channels being read or unfinished uploads behind.
+        for channel_task in channel_tasks:
+            channel_task.cancel()
+        for extraction in extractions:
+            await extraction.abort()
+        raise
 
     end_time = dt.datetime.now()
-    logger.info(f'{message_counter} total messages extracted.')
-    logger.info(f'Logs copied to tmp folder. Time elapsed = {end_time - start_time}')
+    logger.info(f'{sum(e.message_counter for e in extractions)} total messages extracted.')
+    logger.info(f'Data sets uploaded: {", ".join(e.extraction_id for e in extractions)}. '
+                f'Time elapsed = {end_time - start_time}')
 
-    # S3
-    logger.info('Uploading to S3...')
-    start_time = dt.datetime.now()
-    upload_to_s3(text_file_name)
-    upload_to_s3(channel_file_name)
-    end_time = dt.datetime.now()
-    logger.info(f'Files uploaded to S3: {extraction_id}. Time elapsed = {end_time - start_time}')
+    for extraction in extractions:
+        subject = extraction.subject
 
-    # Add data set to database
-    session = bot.get_cog('ConnectionManager').session
-    db_queries.create_data_set(session, ctx, subject, extraction_id)
+        # Add data set to database
+        db_queries.create_data_set(session, ctx, subject, extraction.extraction_id, extraction.checkpoints)
 
-    # Add auto_filters to database
-    filters = find_common_prefixes(auto_filters)[:MAX_AUTO_FILTERS]
-    filters_added = db_queries.add_multiple_filters(session, ctx, subject, filters)
+        # Add auto_filters to database
+        filters = extraction.auto_filters.most_common(MAX_AUTO_FILTERS)
+        filters_added = db_queries.add_multiple_filters(session, ctx, subject, filters)
 
-    # Bot replies
-    await bot.wait_until_ready()
-    await asyncio.sleep(1)
+        # Bot replies
+        await bot.wait_until_ready()
+        await asyncio.sleep(1)
 
-    if filters_added:
-        filter_phrase = '\n'.join(filters_added)
-        await ctx.send(f'Added the following filters for {subject.name}:\n```{filter_phrase}```')
+        if filters_added:
+            filter_phrase = '\n'.join(filters_added)
+            await ctx.send(f'Added the following filters for {subject.name}:\n```{filter_phrase}```')
 
-    await ctx.send(f'Extraction complete for {subject}. Found {message_counter} total messages:',
-                   files=[discord.File(text_file_name), discord.File(channel_file_name)])
+        if extraction.previous_data_uid:
+            found_phrase = f'Found {extraction.message_counter} new messages since your last data set'
+        else:
+            found_phrase = f'Found {extraction.message_counter} total messages'
+        await ctx.send(f'Extraction complete for {subject}. {found_phrase}:',
+                       files=await extraction.attachments(store))
 
     if unreadable_channels:
         if len(unreadable_channels) == 1:
@@ -157,18 +317,6 @@ async def extract_chat_history(ctx, subject, bot):
                            'channels that I do not have permission to read.')
         chs = ', '.join(unreadable_channels)
         logger.info(f'Unreadable channels: {chs}')
-    
+
     await ctx.message.author.send(f'Finished your extraction task! See also, my message in '
                                   f'`#{ctx.message.channel.name}` on `{ctx.message.guild.name}` for more information.')
-
-    # Disk cleanup
-    os.remove(text_file_name)
-    os.remove(channel_file_name)
-
-    if ctx.invoked_with == 'generate':
-        # Start the next step in the process...
-
-        await ctx.send('Starting task 2 of 4...')
-        plots_cog = bot.get_cog('PlotCommands')
-        await ctx.send('Activity plot request submitted...')
-        await plots_cog.process_activity(ctx, subject, extraction_id)
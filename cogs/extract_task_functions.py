@@ -1,11 +1,12 @@
 import re
-import boto3
 import string
-import sys
-from discord.utils import get
+from collections import Counter, OrderedDict
 from cogs.config import *
 
-discord_id_re = re.compile('<@.?[0-9]*?>')
+# Number of user names kept in memory for converting mentions
+MAX_CACHED_NAMES = 10**4
+
+discord_id_re = re.compile(r'<@[!&]?([0-9]+)>')
 suspicious_characters = set(string.punctuation
                                   .replace('@', '')
                                   .replace('#', '')
@@ -13,23 +14,53 @@ suspicious_characters = set(string.punctuation
                             )
 
 
-def mentions_to_names(s, bot):
-    """Converts the text of a mention to the format @<User#0000>"""
-    matches = discord_id_re.findall(s)
-    for mention in matches:
-        discord_id = mention.replace('<@', '') \
-            .replace('>', '') \
-            .replace('i', '') \
-            .replace('!', '') \
-            .replace('&', '')
-
-        user = get(bot.get_all_members(), id=int(discord_id))
+class MemberNameCache:
+    """Maps Discord ids to @<User#0000> names. Users are looked up by id in the bot's own user cache so a lookup costs
+    the same no matter how many servers the bot is in. The most recently used names are kept."""
+    def __init__(self, max_size=MAX_CACHED_NAMES):
+        self.max_size = max_size
+        self.names = OrderedDict()
+
+    def get(self, discord_id, bot):
+        name = self.names.get(discord_id)
+        if name:
+            self.names.move_to_end(discord_id)
+            return name
+
+        user = bot.get_user(discord_id)
         if user:
-            s = s.replace(mention, f'@{user.name}#{user.discriminator}')
+            name = f'@{user.name}#{user.discriminator}'
         else:
-            s = s.replace(mention, '@UNKNOWN_USER')
+            name = '@UNKNOWN_USER'
+
+        self.names[discord_id] = name
+        if len(self.names) > self.max_size:
+            self.names.popitem(last=False)
+
+        return name
+
+    def discard(self, discord_id):
+        """Call this when a user's name changes or they become visible to the bot"""
+        self.names.pop(discord_id, None)
+
+
+# Shared by all extraction tasks. CoreCommands keeps it up to date from member events.
+member_names = MemberNameCache()
+
 
-    return s
+def mentions_to_names(s, bot, names=member_names):
+    """Converts the text of a mention to the format @<User#0000>"""
+    return mentions_to_names_batch([s], bot, names)[0]
+
+
+def mentions_to_names_batch(messages, bot, names=member_names):
+    """Converts the mentions in a list of messages. Each message is rewritten in a single pass with the id captured
+    directly by the regex."""
+    def replace(match):
+        return names.get(int(match.group(1)), bot)
+
+    sub = discord_id_re.sub
+    return [sub(replace, s) if '<@' in s else s for s in messages]
 
 
 def likely_a_bot_command(s):
@@ -43,27 +74,40 @@ def likely_a_bot_command(s):
         return False
 
 
-def find_common_prefixes(filters):
-    """For example, take ['df!generate', 'df!help', ...] and return ['df!']"""
-    common_prefixes = []
-    for fil in filters:
-        if any((prefix in fil) for prefix in common_prefixes):
-            continue
+def command_prefix(command):
+    """Returns a command up to and including its first suspicious character, e.g. 'df!' for 'df!generate'"""
+    for i, c in enumerate(command):
+        if c in suspicious_characters:
+            return command[:i + 1]
+    return command
+
+
+class CommandPrefixCounter:
+    """Counts the prefixes of likely bot commands as messages are read. Every message is counted so the most used
+    prefixes can be picked at the end no matter how many commands were found."""
+    def __init__(self, commands=()):
+        self.counts = Counter()
+        self.update(commands)
 
-        min_idx = sys.maxsize
-        for p in suspicious_characters:
-            idx = fil.find(p)
-            if (idx > -1) and (idx < min_idx):
-                min_idx = idx
+    def update(self, commands):
+        self.counts.update(map(command_prefix, commands))
 
-        common_prefixes.append(fil[:min_idx+1])
+    def add_messages(self, messages):
+        self.update(filter(None, map(likely_a_bot_command, messages)))
 
-    return common_prefixes
+    def merge(self, other):
+        self.counts.update(other.counts)
 
+    def most_common(self, k=None):
+        """The k most used prefixes, most used first. Filters match anywhere in a message so prefixes containing one
+        that's already been picked are left out."""
+        prefixes = []
+        for prefix, _ in self.counts.most_common(k):
+            if not any((p in prefix) for p in prefixes):
+                prefixes.append(prefix)
+        return prefixes
 
-def upload_to_s3(file_name):
-    s3 = boto3.resource('s3',
-                        aws_access_key_id=aws_access_key_id,
-                        aws_secret_access_key=aws_secret_access_key)
 
-    s3.Object(aws_s3_bucket_prefix, f'{file_name}'.strip('./tmp/')).upload_file(f'{file_name}')
+def find_common_prefixes(filters):
+    """For example, take ['df!generate', 'df!help', ...] and return ['df!']"""
+    return CommandPrefixCounter(filters).most_common()
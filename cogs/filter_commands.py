@@ -1,6 +1,24 @@
 import discord
+import asyncio
+import functools
 from discord.ext import commands
 from cogs import db_queries
+from cogs import object_store
+from lambdas.common import dataset
+from lambdas.common import message_filter
+
+
+def count_filtered(texts, filters, word_to_try=None):
+    """Counts the messages removed by a set of filters and how many more one extra filter would remove"""
+    matcher = message_filter.MessageFilter(filters)
+    total, removed, removed_by_word = 0, 0, 0
+    for text in texts:
+        total += 1
+        if matcher.matches(text):
+            removed += 1
+        elif word_to_try and word_to_try in text:
+            removed_by_word += 1
+    return total, removed, removed_by_word
 
 
 class FilterCommands(commands.Cog):
@@ -53,3 +71,26 @@ class FilterCommands(commands.Cog):
     async def clear_all(self, ctx, subject: discord.Member):
         db_queries.clear_filters(self.session, ctx, subject)
         await ctx.send(f'Text filters removed for `{subject.name}` on this server.')
+
+    @filter.command()
+    @commands.cooldown(5, 300, type=commands.BucketType.user)
+    async def preview(self, ctx, subject: discord.Member, *, word_to_try=None):
+        data_uid = await db_queries.get_latest_dataset(self.session, ctx, subject)
+        if not data_uid:
+            return
+
+        filters = db_queries.find_filters(self.session, ctx, subject)
+        store = object_store.get_object_store()
+        loop = asyncio.get_event_loop()
+        data_set = await loop.run_in_executor(None, dataset.load_data_set, data_uid,
+                                              functools.partial(object_store.read_object, store))
+        try:
+            total, removed, removed_by_word = await loop.run_in_executor(None, count_filtered, data_set.texts(),
+                                                                         filters, word_to_try)
+        finally:
+            data_set.close()
+
+        msg = f'The filters for `{subject.name}` on this server remove {removed} of {total} messages.'
+        if word_to_try:
+            msg += f' Adding `{word_to_try}` would remove {removed_by_word} more.'
+        await ctx.send(msg)
@@ -0,0 +1,152 @@
+import os
+import json
+import asyncio
+import importlib
+import logging
+import tempfile
+import multiprocessing
+import boto3
+import botocore
+import botocore.config
+from botocore.errorfactory import ClientError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from cogs import object_store
+from cogs.config import *
+
+logger = logging.getLogger(__name__)
+
+# Longest a Lambda function can run for, in seconds
+INVOKE_TIMEOUT = 900
+
+# Lambda functions that can be running at once before more requests have to wait
+MAX_INVOCATIONS = 16
+
+# Modules with the handler behind each lambda function, for running them locally
+LOCAL_HANDLERS = {
+    lambda_markov_name: 'lambdas.markofivy.lambda_markovify',
+    lambda_wordcloud_name: 'lambdas.wordcloud.lambda_wordcloud',
+    lambda_activity_name: 'lambdas.activity.lambda_activity',
+}
+
+
+def uploaded_files(response, expected_files):
+    """The expected files that weren't small enough to come back in the response"""
+    inline = response.get('inline', {}) if isinstance(response, dict) else {}
+    return [file_name for file_name in expected_files if file_name not in inline]
+
+
+class AwsLambdaBackend:
+    """Invokes our AWS Lambda functions and waits for them to finish, then copies their files from S3"""
+    def __init__(self):
+        # Wait as long as a function can run for rather than retrying a request that's still running
+        client_config = botocore.config.Config(read_timeout=INVOKE_TIMEOUT, retries={'max_attempts': 0})
+        self.lambda_client = boto3.client('lambda', region_name='us-east-1', config=client_config)
+        self.store = object_store.get_object_store()
+
+        # Each invocation holds a thread until the function returns. Keep them away from the default executor.
+        self.invokers = ThreadPoolExecutor(MAX_INVOCATIONS)
+
+    def invoke(self, lambda_name, request_data):
+        response = self.lambda_client.invoke(
+            FunctionName=lambda_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(request_data),
+        )
+        payload = response['Payload'].read().decode('utf-8')
+        if response.get('FunctionError'):
+            raise LambdaError(f'{lambda_name} failed: {payload}')
+        return json.loads(payload)
+
+    async def run(self, lambda_name, request_data, expected_files):
+        """Runs a lambda function and copies the result files that weren't returned inline to the ./tmp folder. Returns
+        the function's response or None if it failed."""
+        loop = asyncio.get_event_loop()
+        try:
+            response = await loop.run_in_executor(self.invokers, self.invoke, lambda_name, request_data)
+            for file_name in uploaded_files(response, expected_files):
+                await loop.run_in_executor(None, self.store.download_file, file_name, f'./tmp/{file_name}')
+        except (LambdaError, object_store.ArtifactNotFound, botocore.exceptions.BotoCoreError, ClientError) as e:
+            logger.error(f'{lambda_name} failed: {e!r}')
+            return None
+
+        return response
+
+
+class LambdaError(Exception):
+    """Raised when a lambda function returns an error"""
+    pass
+
+
+def start_worker(store, artifact_path):
+    """Points the handlers in a worker process at the bot's artifact store"""
+    os.environ['DEEPFAKE_ARTIFACT_STORE'] = store
+    os.environ['DEEPFAKE_LOCAL_ARTIFACT_PATH'] = artifact_path
+    os.environ['AWS_ACCESS_KEY_ID'] = aws_access_key_id
+    os.environ['AWS_SECRET_ACCESS_KEY'] = aws_secret_access_key
+
+
+def run_handler(lambda_name, request_data):
+    """Runs a handler in a worker process. The workers share this machine's /tmp, so each invocation gets a folder of
+    its own and two requests for the same data set or model don't overwrite each other's files."""
+    handler = importlib.import_module(LOCAL_HANDLERS[lambda_name]).lambda_handler
+    with tempfile.TemporaryDirectory() as folder:
+        return handler(dict(request_data, tmp_folder=folder), None)
+
+
+class LocalLambdaBackend:
+    """Runs the lambda handlers in a pool of worker processes on this machine. The handlers read and write the same
+    artifact store as the bot, so a small deployment or a test can run without AWS."""
+    def __init__(self, workers=local_lambda_workers, store=artifact_store, artifact_path=local_artifact_path):
+        if store == 'memory':
+            raise ValueError('The worker processes can\'t share an in-memory artifact store')
+
+        artifact_path = os.path.abspath(artifact_path)
+        self.store = object_store.LocalObjectStore(artifact_path) if store == 'local' \
+            else object_store.S3ObjectStore(aws_s3_bucket_prefix, aws_access_key_id, aws_secret_access_key)
+
+        self.workers = workers
+        self.worker_args = (store, artifact_path)
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        # Forking a process that's running an event loop and boto3's threads isn't safe
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=start_worker, initargs=self.worker_args)
+
+    async def run(self, lambda_name, request_data, expected_files):
+        """Runs a lambda function and copies the result files that weren't returned inline to the ./tmp folder. Returns
+        the function's response or None if it failed."""
+        loop = asyncio.get_event_loop()
+        pool = self.pool
+        try:
+            response = await loop.run_in_executor(pool, run_handler, lambda_name, request_data)
+            for file_name in uploaded_files(response, expected_files):
+                await loop.run_in_executor(None, self.store.download_file, file_name, f'./tmp/{file_name}')
+        except BrokenProcessPool as e:
+            # A worker died, e.g. it ran out of memory, and the pool won't run anything else. Start a new one unless
+            # another request already has.
+            logger.error(f'{lambda_name} failed: {e!r}')
+            if self.pool is pool:
+                pool.shutdown(wait=False)
+                self.pool = self.start_pool()
+            return None
+        except Exception as e:
+            logger.error(f'{lambda_name} failed: {e!r}')
+            return None
+
+        return response
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+backend = None
+
+
+def get_lambda_backend():
+    """Returns the backend selected in config.py. It's shared so the bot only starts one pool of workers."""
+    global backend
+    if backend is None:
+        backend = LocalLambdaBackend() if lambda_backend == 'local' else AwsLambdaBackend()
+    return backend
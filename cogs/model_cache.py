@@ -0,0 +1,38 @@
+"""Reuses Markov chain models. Generating a model from the same data set with the same filters and settings gives the
+same chain, so the model's record is tagged with a hash of those inputs and a later request for them is answered from
+the stored model without invoking the lambda function. Entries expire along with the models, see
+db_queries.find_cached_markov_model()."""
+import json
+import hashlib
+import botocore
+from cogs import object_store
+from lambdas.common import markov_model
+from lambdas.common.message_filter import MessageFilter
+
+
+def model_cache_key(data_uid, filters, state_size, newline):
+    """Hash of everything a model is generated from. Filters are compared the way they're applied, so their order and
+    any duplicates don't matter."""
+    inputs = {
+        'data_uid': data_uid,
+        'filters': sorted(MessageFilter(filters).filters),
+        'state_size': int(state_size),
+        'newline': bool(newline),
+        'version': markov_model.VERSION
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def generate_responses(store, model_uid, number_responses):
+    """Generates sample responses from a stored model the same way the markovify lambda function does. Returns None if
+    the model can't be found."""
+    try:
+        data = object_store.read_object(store, markov_model.model_file_name(model_uid))
+    except (OSError, botocore.exceptions.ClientError):
+        return None
+
+    model = markov_model.CompiledModel(data)
+    try:
+        return [str(sentence) for sentence in model.make_sentences(number_responses, tries=100)]
+    finally:
+        model.close()
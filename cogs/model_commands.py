@@ -3,25 +3,26 @@ from discord.ext import commands
 from cogs import db_queries
 from cogs import config
 from cogs import lambda_commands
+from cogs import model_cache
+from cogs import object_store
+import asyncio
 import logging
 import uuid
-import os
 
 logger = logging.getLogger(__name__)
 
+NUMBER_RESPONSES = 10
+
 
 class ModelCommands(lambda_commands.LambdaCommand):
     """Commands related to generating Markov chain models"""
 
-    async def markovify_response(self, ctx, subject, model_uid):
+    async def markovify_response(self, response, ctx, subject, model_uid):
         """What the bot should do if a Markov chain model is successfully generated"""
+        responses = self.read_result(response, f'{model_uid}-sample-responses.txt').split(config.unique_delimiter)
+        await self.send_responses(ctx, subject, model_uid, responses)
 
-        # Open the file
-        sample_response_file_name = f'./tmp/{model_uid}-sample-responses.txt'
-        with open(sample_response_file_name, encoding='utf-8') as f:
-            responses = f.read().split(config.unique_delimiter)
-
-        # Respond
+    async def send_responses(self, ctx, subject, model_uid, responses):
         await ctx.message.channel.send(
             f'Request complete!  model_uid: `{model_uid}`. Replying in the style of {subject.name}:'
         )
@@ -31,31 +32,55 @@ class ModelCommands(lambda_commands.LambdaCommand):
             res += f'```{responses[i]}```\n'
             await ctx.message.channel.send(res)
 
-        # Cleanup
-        os.remove(sample_response_file_name)
+    async def cached_markovify(self, ctx, subject, cache_key):
+        """Replies from a model already generated with the same inputs. Returns False if there isn't one."""
+        model_uid = db_queries.find_cached_markov_model(self.parent_cog.session, cache_key)
+        if not model_uid:
+            return False
+
+        loop = asyncio.get_event_loop()
+        responses = await loop.run_in_executor(None, model_cache.generate_responses,
+                                               object_store.get_object_store(), model_uid, NUMBER_RESPONSES)
+        if responses is None:
+            logger.info(f'Cached model {model_uid} not found. Evicting it.')
+            db_queries.evict_cached_markov_model(self.parent_cog.session, model_uid)
+            return False
+
+        db_queries.use_markov_model(self.parent_cog.session, model_uid)
+        await self.send_responses(ctx, subject, model_uid, responses)
+        return True
 
     async def process_markovify(self, ctx, subject, data_uid, filters, state_size, new_line):
+        # Skip training if this data set has already been used with the same settings
+        cache_key = model_cache.model_cache_key(data_uid, filters, state_size, new_line)
+        if await self.cached_markovify(ctx, subject, cache_key):
+            return
+
         model_uid = str(uuid.uuid4().hex)
         sample_response_file_name = f'{model_uid}-sample-responses.txt'
 
+        # The lambda function can update the previous model instead of starting over if the data set has only grown
+        previous_model = db_queries.find_latest_markov_model(self.parent_cog.session, ctx, subject)
+
         request_data = {
             "data_uid": data_uid,
             "model_uid": model_uid,
             "filters": filters,
             "state_size": state_size,
             "new_line": new_line,
-            "number_responses": 10
+            "number_responses": NUMBER_RESPONSES,
+            "previous_model_uid": previous_model.model_uid if previous_model else None
         }
 
         # Invoke the lambda function
-        ok = await self.get_lambda_files(config.lambda_markov_name, request_data, [sample_response_file_name], 10,
+        ok = await self.get_lambda_files(config.lambda_markov_name, request_data, [sample_response_file_name],
                                          self.markovify_response, ctx, subject, model_uid)
 
         if not ok:
             # TODO: add link to documentation
             await ctx.send(f'Markov chain generator failed for {subject.name}.')
         else:
-            db_queries.create_markov_model(self.parent_cog.session, data_uid, model_uid)
+            db_queries.create_markov_model(self.parent_cog.session, data_uid, model_uid, cache_key)
 
     @commands.group(name='markovify')
     async def markovify(self, ctx):
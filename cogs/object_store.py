@@ -0,0 +1,75 @@
+import io
+import asyncio
+from cogs.config import *
+from lambdas.common.storage import S3ObjectStore, LocalObjectStore, MemoryObjectStore, ArtifactNotFound
+
+# S3 needs every part of a multipart upload except the last one to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024**2
+
+# Number of parts that can be uploading at once before writers have to wait
+MAX_PENDING_PARTS = 2
+
+# Objects kept by the 'memory' store only last as long as the bot runs
+memory_store = MemoryObjectStore()
+
+
+def get_object_store():
+    """Returns the object store selected in config.py"""
+    if artifact_store == 'local':
+        return LocalObjectStore(local_artifact_path)
+    elif artifact_store == 'memory':
+        return memory_store
+    else:
+        return S3ObjectStore(aws_s3_bucket_prefix, aws_access_key_id, aws_secret_access_key)
+
+
+def read_object(store, key):
+    """Reads a whole object into memory"""
+    return store.read(key)
+
+
+class StreamingUpload:
+    """Uploads whatever is written to it in parts while writing continues, so only a few parts are ever held in memory
+    and nothing touches the disk."""
+    def __init__(self, store, key, part_size=MIN_PART_SIZE):
+        self.store = store
+        self.key = key
+        self.part_size = part_size
+        self.loop = asyncio.get_event_loop()
+        self.buffer = io.BytesIO()
+        self.upload_id = None
+        self.parts = []
+
+    async def start(self):
+        self.upload_id = await self.loop.run_in_executor(None, self.store.start_upload, self.key)
+
+    async def write(self, data):
+        self.buffer.write(data)
+        await self.flush()
+
+    async def flush(self, force=False):
+        """Starts uploading the buffer as the next part once it is big enough"""
+        if self.buffer.tell() < self.part_size and not force:
+            return
+
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+        part_number = len(self.parts) + 1
+        self.parts.append(self.loop.run_in_executor(None, self.store.upload_part,
+                                                    self.key, self.upload_id, part_number, data))
+
+        # Wait for older parts to finish before buffering any more
+        if len(self.parts) > MAX_PENDING_PARTS:
+            await self.parts[-MAX_PENDING_PARTS - 1]
+
+    async def close(self):
+        if self.buffer.tell() or not self.parts:
+            await self.flush(force=True)
+        parts = await asyncio.gather(*self.parts)
+        await self.loop.run_in_executor(None, self.store.complete_upload, self.key, self.upload_id, list(parts))
+
+    async def abort(self):
+        await asyncio.gather(*self.parts, return_exceptions=True)
+        await self.loop.run_in_executor(None, self.store.abort_upload, self.key, self.upload_id)
@@ -13,16 +13,15 @@ logger = logging.getLogger(__name__)
 
 class PlotCommands(lambda_commands.LambdaCommand):
 
-    async def activity_reponse(self, ctx, subject, image_file_names):
+    async def activity_reponse(self, response, ctx, subject, image_file_names):
         """What the bot should do if activity plots are successfully generated"""
         for image_file_name in image_file_names:
             await ctx.send(f'', file=discord.File(f'./tmp/{image_file_name}'))
             os.remove(f'./tmp/{image_file_name}')
 
-    async def wordcloud_response(self, ctx, subject, image_file_name, response_file_name, dirty=False):
+    async def wordcloud_response(self, response, ctx, subject, image_file_name, response_file_name, dirty=False):
         """What the bot should do if a wordcloud is  successfully generated"""
-        with open(f'./tmp/{response_file_name}') as f:
-            response = json.loads(f.read())
+        response = json.loads(self.read_result(response, response_file_name))
 
         if not dirty:
             total_messages = response['total_messages']
@@ -40,7 +39,6 @@ class PlotCommands(lambda_commands.LambdaCommand):
 
         # Cleanup
         os.remove(f'./tmp/{image_file_name}')
-        os.remove(f'./tmp/{response_file_name}')
 
     async def process_activity(self, ctx, subject, data_uid):
         """Function for handling activity plots. Need to make this separate from the command so it can be called by
@@ -60,12 +58,12 @@ class PlotCommands(lambda_commands.LambdaCommand):
 
         # Invoke the lambda function
         ok = await self.get_lambda_files(config.lambda_activity_name, payload,
-                                         expected_files, 10,
+                                         expected_files,
                                          self.activity_reponse, ctx, subject, expected_files)
 
         if not ok:
             await ctx.send(
-                           f'Activity plot request timed out. Maybe try again. You can also report this here:'
+                           f'Activity plot request failed. Maybe try again. You can also report this here:'
                            f' {config.report_issue_url}'
                           )
         elif ctx.invoked_with == 'generate':
@@ -90,13 +88,13 @@ class PlotCommands(lambda_commands.LambdaCommand):
 
         # Invoke the lambda function
         ok = await self.get_lambda_files(config.lambda_wordcloud_name, payload,
-                                         [wordcloud_file_name, response_file_name], 10,
+                                         [wordcloud_file_name, response_file_name],
                                          self.wordcloud_response, ctx, subject, wordcloud_file_name,
                                          response_file_name, dirty)
 
         if not ok:
             await ctx.send(
-                           f'Wordcloud request timed out. Maybe try again. You can also report this here:'
+                           f'Wordcloud request failed. Maybe try again. You can also report this here:'
                            f' {config.report_issue_url}'
                           )
         elif ctx.invoked_with == 'generate':
@@ -2,13 +2,17 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import datetime as dt
 import numpy as np
-import boto3
+import os
 import matplotlib.dates as mdates
+from lambdas.common import dataset
+from lambdas.common import storage
 from pandas.plotting import register_matplotlib_converters
 from matplotlib import cm
 
 register_matplotlib_converters()
 
+SECONDS_PER_DAY = 24 * 60 * 60
+
 
 def lambda_handler(event, context):
 
@@ -18,20 +22,26 @@ def lambda_handler(event, context):
     image_uid = event['image_uid']
 
     # Download the data set from S3
-    data_file_name = f'{data_uid}-channels.csv.gz'
-    aws_s3_bucket_prefix = 'deepfake-discord-bot'
-    s3 = boto3.resource('s3')
-    s3.Bucket(aws_s3_bucket_prefix) \
-        .download_file(data_file_name, '/tmp/' + data_file_name)
+    store = storage.get_object_store()
+    folder = storage.tmp_folder(event)
+    try:
+        data_file_name = dataset.data_file_name(data_uid)
+        store.download_file(data_file_name, f'{folder}/{data_file_name}')
+    except Exception:
+        # Data sets extracted before the indexed format existed only need the channels file
+        data_file_name = f'{data_uid}-channels.csv.gz'
+        store.download_file(data_file_name, f'{folder}/{data_file_name}')
+
+    # Count the messages once and make the plots from the counts
+    activity = Activity.load(data_uid, folder)
 
-    # Make the plots
-    activity_file = time_series_chart(data_uid, image_uid, user_name)
+    activity_file = time_series_chart(activity, image_uid, user_name, folder)
 
-    channels_file = channels_chart(data_uid, image_uid, user_name)
+    channels_file = channels_chart(activity, image_uid, user_name, folder)
 
     # Upload to S3
-    s3.Object(aws_s3_bucket_prefix, activity_file).upload_file(f'/tmp/{activity_file}')
-    s3.Object(aws_s3_bucket_prefix, channels_file).upload_file(f'/tmp/{channels_file}')
+    store.upload_file(f'{folder}/{activity_file}', activity_file)
+    store.upload_file(f'{folder}/{channels_file}', channels_file)
 
     return {
         'statusCode': 200,
@@ -39,20 +49,71 @@ def lambda_handler(event, context):
     }
 
 
-def day_filler(dates, counts):
-    """Returns completed lists of dates and message counts with 0's added to every day with no messages"""
-    filled_dates = []
-    filled_counts = []
-    for n in range(int((dates.max() - dates.min()).days) + 1):
-        single_date = dates.min() + dt.timedelta(n)
-        filled_dates.append(single_date)
-        if single_date in dates:
-            i = np.where(dates == single_date)
-            filled_counts.append(counts[i])
+def read_channels(data_id, folder=storage.TMP_FOLDER):
+    """Reads the timestamp and channel of every message in a data set extracted before the indexed format existed"""
+    data_file_name = f'{data_id}-channels.csv.gz'
+    try:
+        return pd.read_csv(f'{folder}/{data_file_name}', compression='gzip', encoding='utf-8')
+    except FileNotFoundError:
+        return pd.read_csv(f'./tmp/{data_file_name}', compression='gzip', encoding='utf-8')
+
+
+def daily_counts(timestamps):
+    """Returns every day from the first message to the last and the number of messages sent on each, with 0's for the
+    days with no messages. Days are in UTC, the Lambda functions' time zone."""
+    days = np.asarray(timestamps).astype(np.int64) // SECONDS_PER_DAY
+    first_day = days.min()
+    counts = np.bincount(days - first_day)
+    dates = np.arange(first_day, first_day + counts.size).astype('datetime64[D]')
+    return dates, counts
+
+
+class Activity:
+    """Message counts for a data set, made in one pass over its timestamps and channels. Every chart is drawn from
+    these.
+
+    dates, day_counts       every day from the first message to the last and the messages sent on it
+    channels, channel_counts
+                            channel names in alphabetical order and the messages sent in each
+    weekday_counts          messages sent on each day of the week, Monday first
+    hour_counts             messages sent in each hour of the day
+    date_range              time between the first message and the last
+
+    channels is the channel of every message, or with channel_counts the distinct channels and the messages in each.
+    """
+    def __init__(self, timestamps, channels, channel_counts=None):
+        timestamps = np.asarray(timestamps).astype(np.int64)
+        days = timestamps // SECONDS_PER_DAY
+
+        self.dates, self.day_counts = daily_counts(timestamps)
+        if channel_counts is None:
+            self.channels, self.channel_counts = np.unique(np.asarray(channels, dtype=str), return_counts=True)
         else:
-            filled_counts.append(0)
-
-    return filled_dates, filled_counts
+            channels, channel_counts = np.asarray(channels, dtype=str), np.asarray(channel_counts)
+            order = np.argsort(channels)
+            order = order[channel_counts[order] > 0]
+            self.channels, self.channel_counts = channels[order], channel_counts[order]
+
+        # 1 January 1970 was a Thursday
+        self.weekday_counts = np.bincount((days + 3) % 7, minlength=7)
+        self.hour_counts = np.bincount(timestamps % SECONDS_PER_DAY // 3600, minlength=24)
+        self.date_range = dt.timedelta(seconds=int(timestamps.max() - timestamps.min()))
+
+    @classmethod
+    def load(cls, data_id, folder=storage.TMP_FOLDER):
+        """Reads a data set downloaded to folder and counts its messages. Indexed data sets are counted straight from
+        their columns, without looking up each message's channel name."""
+        data_file_name = f'{folder}/{dataset.data_file_name(data_id)}'
+        if os.path.exists(data_file_name):
+            data_set = dataset.DataSetReader.open(data_file_name)
+            try:
+                channel_counts = np.bincount(data_set.channel_codes, minlength=len(data_set.channels))
+                return cls(data_set.timestamps, data_set.channels, channel_counts)
+            finally:
+                data_set.close()
+
+        df = read_channels(data_id, folder)
+        return cls(df['timestamp'].values, df['channel'].values)
 
 
 def auto_time_scale(td):
@@ -73,39 +134,20 @@ def auto_time_scale(td):
     return date_format, major_tick
 
 
-def time_series_chart(data_id, image_uid, user_name):
+def time_series_chart(activity, image_uid, user_name, folder=storage.TMP_FOLDER):
     """Plots a user's activity over time. I.e. number of messages vs. date"""
 
-    # Open our file from S3 and read in the
-    data_file_name = f'/tmp/{data_id}-channels.csv.gz'
-    try:
-        df = pd.read_csv(data_file_name, compression='gzip', encoding='utf-8')
-    except FileNotFoundError:
-        df = pd.read_csv('.' + data_file_name, compression='gzip', encoding='utf-8')
-
-    # Some data transformations
-    df['datetime'] = df['timestamp'].apply(lambda t: dt.datetime.fromtimestamp(t))
-    df['date'] = df['datetime'].apply(lambda t: t.date())
-
-    ch_gb = df.groupby('date')
-    message_dates = ch_gb['date'].count().index.values
-    message_counts = ch_gb['timestamp'].count().values
-
-    filled_dates, filled_counts = day_filler(message_dates, message_counts)
-
     # Make the time series plots
     fig, ax = plt.subplots()
     fig.set_figheight(7)
     fig.set_figwidth(10)
 
-    ax.plot(filled_dates, filled_counts)
+    ax.plot(activity.dates, activity.day_counts)
     ax.set_title(f'{user_name}\'s Activity')
     ax.set_ylabel('# messages')
 
-    message_date_range = df['datetime'].max() - df['datetime'].min()
-
-    if len(filled_dates) > 1:
-        auto_format, auto_tick = auto_time_scale(message_date_range)
+    if len(activity.dates) > 1:
+        auto_format, auto_tick = auto_time_scale(activity.date_range)
         ax.xaxis.set_major_formatter(auto_format)
         ax.xaxis.set_major_locator(auto_tick)
 
@@ -115,29 +157,17 @@ def time_series_chart(data_id, image_uid, user_name):
 
     file_name = f'{image_uid}-activity.png'
     try:
-        fig.savefig(f'/tmp/{file_name}')
+        fig.savefig(f'{folder}/{file_name}')
     except FileNotFoundError:
         fig.savefig(f'./tmp/{file_name}')
 
     return file_name
 
 
-def channels_chart(data_id, image_uid, user_name):
+def channels_chart(activity, image_uid, user_name, folder=storage.TMP_FOLDER):
     """Plots a user's most active channels"""
-
-    # Open our file from S3 and read in the
-    data_file_name = f'/tmp/{data_id}-channels.csv.gz'
-    df = pd.read_csv(data_file_name, compression='gzip', encoding='utf-8')
-
-    # Some data transformations
-    df['datetime'] = df['timestamp'].apply(lambda t: dt.datetime.fromtimestamp(t))
-    df['day'] = df['datetime'].apply(lambda t: t.strftime("%A"))
-    df['date'] = df['datetime'].apply(lambda t: t.date())
-
-    ch_gb = df.groupby('channel')
-
-    pie_labels = ch_gb['timestamp'].count().index.values
-    pie_values = ch_gb['timestamp'].count().values
+    pie_labels = activity.channels
+    pie_values = activity.channel_counts
 
     # Make the channels pie chart
     fig, ax = plt.subplots()
@@ -146,6 +176,6 @@ def channels_chart(data_id, image_uid, user_name):
     ax.set_title(f'{user_name}\'s Favorite Channels')
 
     file_name_channels = f'{image_uid}-pie-chart-channels.png'
-    fig.savefig(f'/tmp/{file_name_channels}')
+    fig.savefig(f'{folder}/{file_name_channels}')
 
     return file_name_channels
@@ -7,6 +7,11 @@ mkdir python
 
 echo "Gathering packages..."
 pip install -r requirements.txt -t ./python
+
+echo "Adding shared modules..."
+mkdir -p python/lambdas
+cp -r common python/lambdas/
+
 zip -r lambda_layer.zip .
 
 echo "Adding to S3..."
@@ -0,0 +1,331 @@
+"""Indexed data set format shared by the bot and the lambda functions.
+
+A data set file is laid out as follows. All integers are little endian.
+
+    header      b'DFDS', uint16 version, uint16 reserved
+    texts       one record per message: uint32 length followed by that many bytes of utf-8 text. The block ends with a
+                record length of 0xFFFFFFFF so it can be read as a stream without the index.
+    index       uint64 file offset of every record, plus the offset of the end marker
+    timestamps  int64 per message
+    channels    uint16 code per message
+    dictionary  json list of channel names, indexed by code
+    footer      message count, section offsets, version and b'DFDS'
+
+Sections after the texts are padded to 8 bytes. Readers can memory-map the file, read a slice of messages through the
+index, or stream the texts from the start. Data sets extracted before this format existed are a delimited text file
+plus a channels csv. LegacyDataSetReader reads those with the same interface.
+"""
+import io
+import sys
+import gzip
+import itertools
+import json
+import mmap
+import hashlib
+import struct
+from array import array
+
+MAGIC = b'DFDS'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+RECORD = struct.Struct('<I')
+END_OF_TEXTS = 0xFFFFFFFF
+FOOTER = struct.Struct('<6QHH4s')
+
+# Used by the older flat text format
+UNIQUE_DELIMITER = '11a4b96a-ae8a-45f9-a4db-487cda63f5bd'
+
+
+def data_file_name(data_uid):
+    return f'{data_uid}-data.dfds'
+
+
+def legacy_file_names(data_uid):
+    return f'{data_uid}-text.dsv.gz', f'{data_uid}-channels.csv.gz'
+
+
+def _little_endian(a):
+    """Returns the bytes of an array in little endian order"""
+    if sys.byteorder == 'big':
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _padding(position):
+    return b'\0' * (-position % 8)
+
+
+class DataSetWriter:
+    """Encodes messages in the indexed format. Each method returns the next bytes of the file rather than writing them
+    so the output can go to any kind of stream."""
+    def __init__(self):
+        self.position = 0
+        self.offsets = array('Q')
+        self.timestamps = array('q')
+        self.channel_codes = array('H')
+        self.channels = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def header(self):
+        self.position = HEADER.size
+        return HEADER.pack(MAGIC, VERSION, 0)
+
+    def channel_code(self, channel):
+        code = self.channels.get(channel)
+        if code is None:
+            code = self.channels[channel] = len(self.channels)
+        return code
+
+    def encode(self, messages):
+        """Encodes (text, timestamp, channel name) tuples"""
+        chunks = []
+        for text, timestamp, channel in messages:
+            data = text.encode()
+            code = self.channel_code(channel)
+
+            self.offsets.append(self.position)
+            self.timestamps.append(timestamp)
+            self.channel_codes.append(code)
+            chunks.append(RECORD.pack(len(data)))
+            chunks.append(data)
+            self.position += RECORD.size + len(data)
+
+        return b''.join(chunks)
+
+    def encode_channel(self, texts, timestamps, channel):
+        """Encodes messages that all came from one channel. Timestamps are added to the column in one go so they can be
+        passed as an array."""
+        records = [text.encode() for text in texts]
+        if len(records) != len(timestamps):
+            raise ValueError('Every message needs a timestamp')
+
+        sizes = array('I', map(len, records))
+        if records:
+            self.offsets.extend(itertools.accumulate([self.position] + [RECORD.size + size for size in sizes[:-1]]))
+        self.position += RECORD.size * len(records) + sum(sizes)
+
+        self.timestamps.extend(timestamps)
+        self.channel_codes.extend(array('H', [self.channel_code(channel)]) * len(records))
+        return b''.join(itertools.chain.from_iterable(zip(map(RECORD.pack, sizes), records)))
+
+    def footer(self):
+        """Encodes the end marker, index columns and footer"""
+        chunks = [RECORD.pack(END_OF_TEXTS)]
+        self.offsets.append(self.position)
+        self.position += RECORD.size
+
+        sections = []
+        for column in [self.offsets, self.timestamps, self.channel_codes]:
+            chunks.append(_padding(self.position))
+            self.position += len(chunks[-1])
+            sections.append(self.position)
+            chunks.append(_little_endian(column))
+            self.position += len(chunks[-1])
+
+        dictionary = json.dumps(list(self.channels)).encode()
+        chunks.append(_padding(self.position))
+        self.position += len(chunks[-1])
+        sections.append(self.position)
+        chunks.append(dictionary)
+        self.position += len(dictionary)
+
+        chunks.append(FOOTER.pack(len(self), *sections, len(dictionary), VERSION, 0, MAGIC))
+        self.position += FOOTER.size
+        return b''.join(chunks)
+
+
+class DataSetReader:
+    """Reads the indexed format from bytes or a memory map without copying the columns"""
+    def __init__(self, buffer):
+        self.mmap = None
+        self.buffer = memoryview(buffer)
+        if len(self.buffer) < HEADER.size + FOOTER.size or bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not an indexed data set')
+
+        count, index_offset, timestamps_offset, codes_offset, dictionary_offset, dictionary_size, version, _, magic = \
+            FOOTER.unpack_from(self.buffer, len(self.buffer) - FOOTER.size)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError(f'Unsupported data set version: {version}')
+
+        self.offsets = self._column(index_offset, 'Q', count + 1)
+        self.timestamps = self._column(timestamps_offset, 'q', count)
+        self.channel_codes = self._column(codes_offset, 'H', count)
+        self.channels = json.loads(bytes(self.buffer[dictionary_offset:dictionary_offset + dictionary_size]).decode())
+
+    def _column(self, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        if sys.byteorder == 'big':
+            column = array(typecode, self.buffer[offset:offset + size])
+            column.byteswap()
+            return column
+        return self.buffer[offset:offset + size].cast(typecode)
+
+    @classmethod
+    def open(cls, file_name):
+        """Memory maps a data set file"""
+        with open(file_name, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        reader = cls(mm)
+        reader.mmap = mm
+        return reader
+
+    def close(self):
+        for view in [self.offsets, self.timestamps, self.channel_codes, self.buffer]:
+            if isinstance(view, memoryview):
+                view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def digest(self, count):
+        """Hash of the first count messages. A data set extracted incrementally starts with the same bytes as the one
+        it was copied from."""
+        return hashlib.sha256(self.buffer[self.offsets[0]:self.offsets[count]]).hexdigest()
+
+    def text(self, i):
+        return bytes(self.buffer[self.offsets[i] + RECORD.size:self.offsets[i + 1]]).decode()
+
+    def texts(self, start=0, stop=None):
+        for i in range(*slice(start, stop).indices(len(self))):
+            yield self.text(i)
+
+    def channel_names(self, start=0, stop=None):
+        for i in range(*slice(start, stop).indices(len(self))):
+            yield self.channels[self.channel_codes[i]]
+
+    def messages(self, start=0, stop=None):
+        """Yields (text, timestamp, channel name) tuples"""
+        for i in range(*slice(start, stop).indices(len(self))):
+            yield self.text(i), self.timestamps[i], self.channels[self.channel_codes[i]]
+
+
+def iter_texts(stream):
+    """Yields the texts of an indexed data set from a binary stream without reading the index"""
+    magic, version, _ = HEADER.unpack(stream.read(HEADER.size))
+    if magic != MAGIC or version > VERSION:
+        raise ValueError('Not an indexed data set')
+
+    while True:
+        length, = RECORD.unpack(stream.read(RECORD.size))
+        if length == END_OF_TEXTS:
+            return
+        yield stream.read(length).decode()
+
+
+def iter_delimited(stream, chunk_size=2**16):
+    """Yields the texts of the older delimited format from a text stream, reading a chunk at a time"""
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        texts = (pending + chunk).split(UNIQUE_DELIMITER)
+        pending = texts.pop()
+        yield from texts
+
+    if pending:
+        yield pending
+
+
+class LegacyDataSetReader:
+    """Reads a data set stored as delimited text plus a channels csv with the same interface as DataSetReader"""
+    def __init__(self, text, channels_csv):
+        self.content = text.split(UNIQUE_DELIMITER)
+        if self.content and self.content[-1] == '':
+            self.content.pop()
+
+        self.timestamps = array('q')
+        self.channel_codes = array('H')
+        self.channels = []
+        codes = {}
+        for row in channels_csv.splitlines()[1:]:
+            timestamp, channel = row.split(',', 1)
+            code = codes.get(channel)
+            if code is None:
+                code = codes[channel] = len(self.channels)
+                self.channels.append(channel)
+            self.timestamps.append(int(timestamp))
+            self.channel_codes.append(code)
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.content)
+
+    def text(self, i):
+        return self.content[i]
+
+    def texts(self, start=0, stop=None):
+        yield from self.content[start:stop]
+
+    def channel_names(self, start=0, stop=None):
+        for code in self.channel_codes[start:stop]:
+            yield self.channels[code]
+
+    def messages(self, start=0, stop=None):
+        yield from zip(self.texts(start, stop), self.timestamps[start:stop], self.channel_names(start, stop))
+
+
+def load_data_set(data_uid, read):
+    """Opens a data set in whichever format it was stored. read(key) should return an object's bytes."""
+    try:
+        return DataSetReader(read(data_file_name(data_uid)))
+    except Exception:
+        text_file_name, channel_file_name = legacy_file_names(data_uid)
+        return LegacyDataSetReader(gzip.decompress(read(text_file_name)).decode(),
+                                   gzip.decompress(read(channel_file_name)).decode())
+
+
+def open_data_set(data_uid, download, folder='/tmp'):
+    """Downloads a data set in whichever format it was stored and opens it. download(key, file_name) should raise an
+    exception if the key doesn't exist. Indexed data sets are memory mapped."""
+    try:
+        download(data_file_name(data_uid), f'{folder}/{data_file_name(data_uid)}')
+        return DataSetReader.open(f'{folder}/{data_file_name(data_uid)}')
+    except Exception:
+        text_file_name, channel_file_name = legacy_file_names(data_uid)
+        download(text_file_name, f'{folder}/{text_file_name}')
+        download(channel_file_name, f'{folder}/{channel_file_name}')
+        with gzip.open(f'{folder}/{text_file_name}', 'rb') as t, gzip.open(f'{folder}/{channel_file_name}', 'rb') as c:
+            return LegacyDataSetReader(t.read().decode(), c.read().decode())
+
+
+def stream_texts(data_uid, download, folder='/tmp'):
+    """Downloads a data set in whichever format it was stored and yields its texts one at a time, so only the message
+    being read is held in memory. download(key, file_name) should raise an exception if the key doesn't exist."""
+    try:
+        download(data_file_name(data_uid), f'{folder}/{data_file_name(data_uid)}')
+    except Exception:
+        text_file_name, _ = legacy_file_names(data_uid)
+        download(text_file_name, f'{folder}/{text_file_name}')
+        with gzip.open(f'{folder}/{text_file_name}', 'rt', encoding='utf-8') as f:
+            yield from iter_delimited(f)
+        return
+
+    with open(f'{folder}/{data_file_name(data_uid)}', 'rb') as f:
+        yield from iter_texts(f)
+
+
+def export_text(reader):
+    """Gzip compressed delimited text, i.e. the older text file format. Handy for training a model by hand."""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        for text in reader.texts():
+            f.write((text + UNIQUE_DELIMITER).encode())
+    return buffer.getvalue()
+
+
+def export_channels(reader):
+    """Gzip compressed csv of timestamps and channels, i.e. the older channels file format"""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        rows = ''.join(f'{timestamp},{reader.channels[code]}\n'
+                       for timestamp, code in zip(reader.timestamps, reader.channel_codes))
+        f.write(f'timestamp,channel\n{rows}'.encode())
+    return buffer.getvalue()
@@ -0,0 +1,625 @@
+"""Compiled markov model format. Loads without parsing the chain and can be memory mapped.
+
+Every word in the chain is interned to an integer id. A state of state_size words is packed into one integer key,
+id_1 * B^(state_size - 1) + ... + id_n where the base B is at least the number of words, so a state can be looked up
+with a binary search over the sorted keys. The transitions out of every state are stored in one table, with offsets
+marking where each state's rows start (compressed sparse rows). Each row holds the next word's id and the running total
+of the weights in that state, so picking the next word is a bisect over a slice of the table. All integers are little
+endian.
+
+    header      b'DFMM', uint16 version, uint16 state size
+    tokens      json list of words, indexed by id. Ids 0 and 1 are markovify's begin and end markers.
+    keys        uint64 key of every state, sorted
+    offsets     uint64 start of every state's transitions, plus the end of the table
+    next        uint32 id of the next word for every transition
+    cumulative  uint64 running total of the transition weights within each state
+    text        utf-8 text of the original sentences, one per line with the words separated by spaces. Used to reject
+                generated sentences that copy it and to update the model without parsing every message again.
+    metadata    json object describing what the model was trained on
+    footer      counts, packing base, section offsets, version, state size and b'DFMM'
+
+Sections are padded to 8 bytes. Models can be compiled from a markovify.Text or converted from its json. A model can be
+brought up to date with a newer data set by adding and removing the transitions of the messages that changed, see
+update_model().
+"""
+import sys
+import gzip
+import json
+import mmap
+import bisect
+import random
+import struct
+import itertools
+import collections
+import numpy as np
+from array import array
+from lambdas.common.dataset import _little_endian, _padding
+from lambdas.common.message_filter import MessageFilter
+
+MAGIC = b'DFMM'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+FOOTER = struct.Struct('<13QHH4s')
+
+# markovify's markers for the start and end of a sentence
+BEGIN = '___BEGIN__'
+END = '___END__'
+
+# Same defaults as markovify.Text.make_sentence
+DEFAULT_TRIES = 10
+DEFAULT_MAX_OVERLAP_RATIO = 0.7
+DEFAULT_MAX_OVERLAP_TOTAL = 15
+
+# Multiplier of the rolling hash used to index the original text's n-grams
+GRAM_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def model_file_name(model_uid):
+    return f'{model_uid}-markov-model.dfmm'
+
+
+def packing_base(size, state_size):
+    """Base for packing states of a vocabulary of size words. Leaves room for the vocabulary to double so updates
+    don't have to repack every key."""
+    if size ** state_size >= 2**64:
+        raise ValueError('Too many words to pack a state into 64 bits')
+    return 2 * size if (2 * size) ** state_size < 2**64 else size
+
+
+def pack_state(ids, base):
+    key = 0
+    for token_id in ids:
+        key = key * base + token_id
+    return key
+
+
+def _sentence_text(sentences):
+    return '\n'.join(' '.join(words) for words in sentences or []).encode()
+
+
+def _encode(state_size, base, tokens, keys, offsets, next_ids, cumulative, text, metadata):
+    chunks = [HEADER.pack(MAGIC, VERSION, state_size)]
+    position = HEADER.size
+    sections = []
+    tokens = json.dumps(tokens).encode()
+    metadata = json.dumps(metadata or {}).encode()
+    for data in [tokens, _little_endian(keys), _little_endian(offsets), _little_endian(next_ids),
+                 _little_endian(cumulative), text, metadata]:
+        chunks.append(_padding(position))
+        position += len(chunks[-1])
+        sections.append(position)
+        chunks.append(data)
+        position += len(data)
+
+    tokens_offset, keys_offset, offsets_offset, next_offset, cumulative_offset, text_offset, metadata_offset = sections
+    chunks.append(FOOTER.pack(len(keys), len(next_ids), base, tokens_offset, len(tokens), keys_offset, offsets_offset,
+                              next_offset, cumulative_offset, text_offset, len(text), metadata_offset, len(metadata),
+                              VERSION, state_size, MAGIC))
+    return b''.join(chunks)
+
+
+def compile_model(state_size, chain, sentences=None, metadata=None):
+    """Encodes a markov chain in the compiled format. chain is an iterable of (state, {next word: weight}) pairs as
+    found in markovify's Chain.model. sentences are the original sentences as lists of words if generated sentences
+    should be checked against them."""
+    token_ids = {BEGIN: 0, END: 1}
+    rows = []
+    for state, next_words in chain:
+        # markovify's compiled chains hold ([words], [cumulative weights]) instead of a dict
+        if isinstance(next_words, dict):
+            words, weights = next_words.keys(), next_words.values()
+        else:
+            words, weights = next_words[0], [w - v for w, v in zip(next_words[1], [0] + next_words[1][:-1])]
+        rows.append(([token_ids.setdefault(word, len(token_ids)) for word in state],
+                     [token_ids.setdefault(word, len(token_ids)) for word in words], weights))
+
+    base = packing_base(len(token_ids), state_size)
+    rows.sort(key=lambda row: pack_state(row[0], base))
+
+    keys = array('Q', (pack_state(row[0], base) for row in rows))
+    offsets = array('Q', [0])
+    next_ids = array('I')
+    cumulative = array('Q')
+    for _, ids, weights in rows:
+        next_ids.extend(ids)
+        cumulative.extend(itertools.accumulate(weights))
+        offsets.append(len(next_ids))
+
+    return _encode(state_size, base, list(token_ids), keys, offsets, next_ids, cumulative, _sentence_text(sentences),
+                   metadata)
+
+
+def compile_text(text_model, metadata=None):
+    """Compiles a markovify.Text. The original sentences are kept if the model retained them."""
+    sentences = text_model.parsed_sentences if getattr(text_model, 'retain_original', False) else None
+    return compile_model(text_model.state_size, text_model.chain.model.items(), sentences, metadata)
+
+
+def convert_json(model_json):
+    """Compiles a model saved with markovify.Text.to_json()"""
+    model = json.loads(model_json) if isinstance(model_json, (str, bytes)) else model_json
+    chain = json.loads(model['chain']) if isinstance(model['chain'], str) else model['chain']
+    if isinstance(chain, dict):
+        chain = chain.items()
+
+    return compile_model(model['state_size'], ((tuple(state), next_words) for state, next_words in chain),
+                         model.get('parsed_sentences'))
+
+
+def to_json(model):
+    """Converts a compiled model back to the json markovify.Text.to_json() writes, for loading with markovify"""
+    return json.dumps({
+        'state_size': model.state_size,
+        'chain': json.dumps(list(model.chain().items())),
+        'parsed_sentences': model.sentences() or None
+    })
+
+
+class CompiledModel:
+    """Generates sentences from a compiled model held in bytes or a memory map, the way markovify.Text does"""
+    def __init__(self, buffer):
+        self.mmap = None
+        self.data = buffer
+        self.buffer = memoryview(buffer)
+        if len(self.buffer) < HEADER.size + FOOTER.size or bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a compiled markov model')
+
+        state_count, transition_count, self.base, tokens_offset, tokens_size, keys_offset, offsets_offset, \
+            next_offset, cumulative_offset, self.text_offset, self.text_size, metadata_offset, metadata_size, \
+            version, self.state_size, magic = FOOTER.unpack_from(self.buffer, len(self.buffer) - FOOTER.size)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError(f'Unsupported markov model version: {version}')
+
+        self.tokens = json.loads(bytes(self.buffer[tokens_offset:tokens_offset + tokens_size]).decode())
+        self.metadata = json.loads(bytes(self.buffer[metadata_offset:metadata_offset + metadata_size]).decode())
+        self.keys = self._column(keys_offset, 'Q', state_count)
+        self.offsets = self._column(offsets_offset, 'Q', state_count + 1)
+        self.next_ids = self._column(next_offset, 'I', transition_count)
+        self.cumulative = self._column(cumulative_offset, 'Q', transition_count)
+        self.begin_key = pack_state([0] * self.state_size, self.base)
+        self.token_ids = None
+        self.sampling_tables = None
+        self.text_id_array = None
+        self.gram_index = {}
+
+    def _column(self, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        if sys.byteorder == 'big':
+            column = array(typecode, self.buffer[offset:offset + size])
+            column.byteswap()
+            return column
+        return self.buffer[offset:offset + size].cast(typecode)
+
+    @classmethod
+    def open(cls, file_name):
+        """Memory maps a compiled model file"""
+        with open(file_name, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        model = cls(mm)
+        model.mmap = mm
+        return model
+
+    def close(self):
+        for view in [self.keys, self.offsets, self.next_ids, self.cumulative, self.buffer]:
+            if isinstance(view, memoryview):
+                view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def token_id(self, word):
+        """Id of a word or None if it isn't in the model"""
+        if self.token_ids is None:
+            self.token_ids = {word: token_id for token_id, word in enumerate(self.tokens)}
+        return self.token_ids.get(word)
+
+    def state_key(self, words):
+        """Packs a state given as words. Returns None if a word isn't in the model."""
+        ids = [self.token_id(word) for word in words]
+        return None if None in ids else pack_state(ids, self.base)
+
+    def state_words(self, key):
+        ids = []
+        for _ in range(self.state_size):
+            key, token_id = divmod(key, self.base)
+            ids.append(token_id)
+        return tuple(self.tokens[token_id] for token_id in reversed(ids))
+
+    def row(self, row):
+        """Decodes the transitions out of one state as {next word id: weight}"""
+        start, end = self.offsets[row], self.offsets[row + 1]
+        weights, total = {}, 0
+        for i in range(start, end):
+            weights[self.next_ids[i]] = self.cumulative[i] - total
+            total = self.cumulative[i]
+        return weights
+
+    def chain(self):
+        """Decodes the transitions as {state: {next word: weight}}, i.e. markovify's Chain.model"""
+        tokens = self.tokens
+        words = [tokens[token_id] for token_id in self.next_ids]
+        cumulative = self.cumulative.tolist()
+        weights = [c - p for c, p in zip(cumulative, [0] + cumulative[:-1])]
+        offsets = self.offsets.tolist()
+
+        # Unpack every key one word position at a time
+        keys = self.keys.tolist()
+        positions = [[tokens[key // self.base ** power % self.base] for key in keys]
+                     for power in reversed(range(self.state_size))]
+
+        chain = {}
+        for row, state in enumerate(zip(*positions)):
+            start, end = offsets[row], offsets[row + 1]
+            # The first weight of each row was taken from the last total of the row before
+            row_weights = weights[start:end]
+            row_weights[0] = cumulative[start]
+            chain[state] = dict(zip(words[start:end], row_weights))
+        return chain
+
+    def text(self):
+        return bytes(self.buffer[self.text_offset:self.text_offset + self.text_size])
+
+    def sentences(self):
+        """The original sentences as lists of words"""
+        if not self.text_size:
+            return []
+        return [line.split(' ') for line in self.text().decode().split('\n')]
+
+    def move(self, key):
+        """Picks the id of the word after a state at random, in proportion to the weights"""
+        row = bisect.bisect_left(self.keys, key)
+        if row == len(self.keys) or self.keys[row] != key:
+            raise KeyError(key)
+        start, end = self.offsets[row], self.offsets[row + 1]
+        r = random.random() * self.cumulative[end - 1]
+        return self.next_ids[bisect.bisect(self.cumulative, r, start, end)]
+
+    def walk(self, init_state=None):
+        """Returns the words of one run through the chain, starting from the beginning of a sentence or the given
+        state"""
+        key = self.begin_key if init_state is None else self.state_key(init_state)
+        if key is None:
+            raise KeyError(init_state)
+
+        modulus = self.base ** (self.state_size - 1)
+        words = []
+        while True:
+            token_id = self.move(key)
+            if token_id == 1:
+                return words
+            words.append(self.tokens[token_id])
+            key = (key % modulus) * self.base + token_id
+
+    def test_sentence_output(self, words, max_overlap_ratio, max_overlap_total):
+        """Rejects sentences that contain a long enough run of words from the original text"""
+        overlap_max = min(max_overlap_total, round(max_overlap_ratio * len(words)))
+        text_end = self.text_offset + self.text_size
+        for i in range(max(len(words) - overlap_max, 1)):
+            gram = ' '.join(words[i:i + overlap_max + 1]).encode()
+            if self.data.find(gram, self.text_offset, text_end) != -1:
+                return False
+        return True
+
+    def make_sentence(self, init_state=None, tries=DEFAULT_TRIES, max_overlap_ratio=DEFAULT_MAX_OVERLAP_RATIO,
+                      max_overlap_total=DEFAULT_MAX_OVERLAP_TOTAL, test_output=True, max_words=None, min_words=None):
+        """Works like markovify.Text.make_sentence. Returns None if no acceptable sentence was found."""
+        prefix = [] if init_state is None else [word for word in init_state if word != BEGIN]
+        for _ in range(tries):
+            words = prefix + self.walk(init_state)
+            if (max_words is not None and len(words) > max_words) or \
+               (min_words is not None and len(words) < min_words):
+                continue
+            if not test_output or not self.text_size or \
+               self.test_sentence_output(words, max_overlap_ratio, max_overlap_total):
+                return ' '.join(words)
+        return None
+
+    def _sampling_tables(self):
+        """numpy views of the tables with the running totals carried across rows, so a single searchsorted over the
+        whole table picks the next word for every sentence being walked"""
+        if self.sampling_tables is None:
+            keys = np.frombuffer(self.keys, np.uint64)
+            offsets = np.frombuffer(self.offsets, np.uint64).astype(np.int64)
+            cumulative = np.frombuffer(self.cumulative, np.uint64)
+            totals = cumulative[offsets[1:] - 1]
+            row_base = np.concatenate([[0], np.cumsum(totals)[:-1]]).astype(np.uint64)
+            running = cumulative + np.repeat(row_base, np.diff(offsets))
+            self.sampling_tables = keys, totals, row_base, running, np.frombuffer(self.next_ids, np.uint32)
+        return self.sampling_tables
+
+    def walk_many(self, count, init_state=None, random_state=None):
+        """Walks the chain count times at once. Returns the word ids of each walk as numpy arrays."""
+        rng = np.random if random_state is None else random_state
+        keys, totals, row_base, running, next_ids = self._sampling_tables()
+        key = self.begin_key if init_state is None else self.state_key(init_state)
+        row = bisect.bisect_left(self.keys, key) if key is not None else len(self.keys)
+        if row == len(self.keys) or self.keys[row] != key:
+            raise KeyError(init_state)
+
+        base = np.uint64(self.base)
+        modulus = np.uint64(self.base ** (self.state_size - 1))
+        current = np.full(count, key, np.uint64)
+        active = np.arange(count)
+        walkers, words = [], []
+        while len(active):
+            rows = np.searchsorted(keys, current)
+            r = np.minimum((rng.random_sample(len(active)) * totals[rows]).astype(np.uint64), totals[rows] - 1)
+            picked = next_ids[np.searchsorted(running, row_base[rows] + r, side='right')]
+
+            going = picked != 1
+            active, picked = active[going], picked[going]
+            walkers.append(active)
+            words.append(picked)
+            current = (current[going] % modulus) * base + picked.astype(np.uint64)
+
+        # Group the words by walk, keeping them in the order they were picked
+        walkers, words = np.concatenate(walkers), np.concatenate(words)
+        order = np.argsort(walkers, kind='stable')
+        return np.split(words[order], np.cumsum(np.bincount(walkers, minlength=count))[:-1])
+
+    def text_ids(self):
+        """The original text as one array of word ids, with the end marker after each sentence"""
+        if self.text_id_array is None:
+            self.token_id(BEGIN)
+            token_ids = self.token_ids
+            ids = array('I')
+            for line in self.text().decode().split('\n'):
+                ids.extend([token_ids.get(word, 0) for word in line.split(' ')])
+                ids.append(1)
+            self.text_id_array = np.frombuffer(ids, np.uint32).astype(np.uint64)
+        return self.text_id_array
+
+    def _gram_index(self, size):
+        """Sorted hashes of every run of size words in the original text. Runs that cross from one sentence into the
+        next contain the end marker, which is never generated, so they don't need leaving out."""
+        if size not in self.gram_index:
+            self.gram_index[size] = np.sort(_hash_grams(self.text_ids(), size))
+        return self.gram_index[size]
+
+    def copies_text(self, sentences, max_overlap_ratio=DEFAULT_MAX_OVERLAP_RATIO,
+                    max_overlap_total=DEFAULT_MAX_OVERLAP_TOTAL):
+        """Checks a batch of sentences given as arrays of word ids the way test_sentence_output() checks one, looking
+        the runs of words up in an index of the original text instead of searching it. Runs only match whole words.
+        Returns a bool array that's True for the sentences that copy the text."""
+        lengths = np.array([len(ids) for ids in sentences], np.int64)
+        overlap = np.minimum(max_overlap_total, np.round(max_overlap_ratio * lengths)).astype(np.int64)
+        sizes = np.minimum(overlap + 1, lengths)
+        windows = np.maximum(lengths - overlap, 1)
+
+        # Empty sentences are found anywhere, like the empty string
+        copied = sizes == 0
+        for size in np.unique(sizes[sizes > 0]):
+            members = np.flatnonzero(sizes == size)
+            stream = np.concatenate([sentences[i] for i in members]).astype(np.uint64)
+            starts = np.concatenate([[0], np.cumsum(lengths[members])[:-1]])
+
+            # Start of every run to look up, and the sentence it belongs to
+            counts = windows[members]
+            owner = np.repeat(np.arange(len(members)), counts)
+            first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            positions = starts[owner] + np.arange(len(owner)) - first[owner]
+
+            index = self._gram_index(int(size))
+            if not len(index):
+                continue
+            hashes = _hash_grams(stream, int(size))[positions]
+            found = index[np.minimum(np.searchsorted(index, hashes), len(index) - 1)] == hashes
+            copied[members[np.unique(owner[found])]] = True
+        return copied
+
+    def make_sentences(self, count, init_state=None, tries=DEFAULT_TRIES,
+                       max_overlap_ratio=DEFAULT_MAX_OVERLAP_RATIO, max_overlap_total=DEFAULT_MAX_OVERLAP_TOTAL,
+                       test_output=True, max_words=None, min_words=None, random_state=None):
+        """Makes count sentences at once. Each one gets up to tries attempts like make_sentence(), but the attempts are
+        walked and checked in batches. Returns a list with None in place of the sentences that failed."""
+        prefix = [] if init_state is None else [self.token_id(word) for word in init_state if word != BEGIN]
+        results = [None] * count
+        pending = list(range(count))
+        used, batch = 0, 1
+        while pending and used < tries:
+            # Sentences that failed already will probably fail again, so try more of them at once each round
+            batch = min(batch, tries - used)
+            candidates = self.walk_many(len(pending) * batch, init_state, random_state)
+            if prefix:
+                candidates = [np.concatenate([np.array(prefix, np.uint32), ids]) for ids in candidates]
+
+            lengths = np.array([len(ids) for ids in candidates])
+            ok = np.ones(len(candidates), bool)
+            if max_words is not None:
+                ok &= lengths <= max_words
+            if min_words is not None:
+                ok &= lengths >= min_words
+            if test_output and self.text_size and ok.any():
+                checked = np.flatnonzero(ok)
+                ok[checked[self.copies_text([candidates[i] for i in checked], max_overlap_ratio,
+                                            max_overlap_total)]] = False
+
+            still_pending = []
+            for n, sentence in enumerate(pending):
+                attempts = np.flatnonzero(ok[n * batch:(n + 1) * batch])
+                if len(attempts):
+                    ids = candidates[n * batch + attempts[0]].tolist()
+                    results[sentence] = ' '.join(self.tokens[token_id] for token_id in ids)
+                else:
+                    still_pending.append(sentence)
+            pending = still_pending
+            used += batch
+            batch *= 2
+        return results
+
+
+def _hash_grams(ids, size):
+    """Rolling hash of every run of size ids"""
+    hashes = np.zeros(max(len(ids) - size + 1, 0), np.uint64)
+    for i in range(size):
+        hashes = hashes * GRAM_HASH_MULTIPLIER + ids[i:i + len(hashes)]
+    return hashes
+
+
+def remove_sentences(sentences, removed):
+    """Returns a copy of sentences with one occurrence of each removed sentence taken out. Raises ValueError if one
+    isn't there."""
+    pending = collections.Counter(tuple(words) for words in removed)
+    result = []
+    for words in sentences:
+        key = tuple(words)
+        if pending[key]:
+            pending[key] -= 1
+        else:
+            result.append(words)
+    if +pending:
+        raise ValueError('Sentences to remove not found in the model')
+    return result
+
+
+def update_compiled(previous, added, removed, metadata=None):
+    """Adds the transitions of the added sentences to a compiled model and takes away those of the removed ones,
+    counting them the way markovify's Chain.build does. Only the states that change are decoded, the rest of the
+    tables are copied across as they are. Raises ValueError if a removed transition isn't in the model. Returns None
+    if the new words don't fit the model's packing base."""
+    state_size = previous.state_size
+    tokens = list(previous.tokens)
+    previous.token_id(BEGIN)
+    token_ids = dict(previous.token_ids)
+
+    # Changes to the weights of each state's transitions, by key
+    changes = {}
+    for sentences, sign in [(added, 1), (removed, -1)]:
+        for words in sentences:
+            ids = [0] * state_size + [token_ids.setdefault(word, len(token_ids)) for word in words] + [1]
+            for i in range(len(words) + 1):
+                weights = changes.setdefault(pack_state(ids[i:i + state_size], previous.base), {})
+                weights[ids[i + state_size]] = weights.get(ids[i + state_size], 0) + sign
+    if len(token_ids) > previous.base:
+        return None
+    tokens += list(token_ids)[len(tokens):]
+
+    keys = array('Q')
+    offsets = array('Q', [0])
+    next_ids = array('I')
+    cumulative = array('Q')
+
+    def copy_rows(first, last):
+        """Copies the unchanged states first to last - 1"""
+        start, end = previous.offsets[first], previous.offsets[last]
+        shift = len(next_ids) - start
+        keys.frombytes(memoryview(previous.keys)[first:last].cast('B'))
+        offsets.extend(offset + shift for offset in previous.offsets[first + 1:last + 1])
+        next_ids.frombytes(memoryview(previous.next_ids)[start:end].cast('B'))
+        cumulative.frombytes(memoryview(previous.cumulative)[start:end].cast('B'))
+
+    row = 0
+    for key in sorted(changes):
+        changed_row = bisect.bisect_left(previous.keys, key, row)
+        copy_rows(row, changed_row)
+        if changed_row < len(previous) and previous.keys[changed_row] == key:
+            weights = previous.row(changed_row)
+            row = changed_row + 1
+        else:
+            weights = {}
+            row = changed_row
+
+        for token_id, change in changes[key].items():
+            weight = weights.get(token_id, 0) + change
+            if weight < 0:
+                raise ValueError(f'No transition from {previous.state_words(key)} to {tokens[token_id]} to remove')
+            elif weight:
+                weights[token_id] = weight
+            else:
+                del weights[token_id]
+
+        if weights:
+            keys.append(key)
+            next_ids.extend(weights.keys())
+            cumulative.extend(itertools.accumulate(weights.values()))
+            offsets.append(len(next_ids))
+    copy_rows(row, len(previous))
+
+    # New sentences are added to the end of the text. It only has to be split up if some are being taken out.
+    if removed:
+        text = _sentence_text(remove_sentences(previous.sentences(), removed) + list(added))
+    else:
+        text = b'\n'.join(t for t in [previous.text(), _sentence_text(added)] if t)
+
+    return _encode(state_size, previous.base, tokens, keys, offsets, next_ids, cumulative, text, metadata)
+
+
+def parse_messages(text_class, messages, state_size):
+    """Splits messages into sentences of words the same way text_class (e.g. markovify.NewlineText) would"""
+    if not messages:
+        return []
+    try:
+        return text_class('\n'.join(messages), state_size=state_size).parsed_sentences
+    except KeyError:
+        # markovify can't build a chain when none of the sentences pass its checks
+        return []
+
+
+def training_metadata(data_set, message_filter, text_class, state_size):
+    """What a model trained on the whole of an indexed data set needs to record so it can be updated later"""
+    return {
+        'messages': len(data_set),
+        'data_digest': data_set.digest(len(data_set)),
+        'filters': message_filter.filters,
+        'text_class': text_class.__name__,
+        'state_size': state_size
+    }
+
+
+def update_model(previous, data_set, message_filter, text_class, state_size):
+    """Brings a previous model up to date with a data set that starts with the messages the model was trained on.
+    Only new messages and those affected by changes to the filters are parsed. Returns the compiled model, or None if
+    it has to be trained from scratch.
+
+    Only newline separated models can be updated, because each message is split into sentences on its own. Text only
+    ends a sentence at punctuation, so a message without any runs on into the next one and the sentences depend on
+    the messages either side."""
+    metadata = previous.metadata
+    count = metadata.get('messages')
+    if text_class.__name__ != 'NewlineText' or metadata.get('text_class') != text_class.__name__ or \
+       metadata.get('state_size') != state_size or not hasattr(data_set, 'digest') or count is None or \
+       count > len(data_set) or data_set.digest(count) != metadata.get('data_digest'):
+        return None
+
+    # Messages the old filters kept but the new ones don't (or the reverse) need taking out of (or adding to) the
+    # chain
+    added, removed = [], []
+    previous_filter = MessageFilter(metadata.get('filters', []))
+    if set(previous_filter.filters) != set(message_filter.filters):
+        for text in data_set.texts(0, count):
+            kept_before, kept_now = not previous_filter.matches(text), not message_filter.matches(text)
+            if kept_before and not kept_now:
+                removed.append(text)
+            elif kept_now and not kept_before:
+                added.append(text)
+
+    added += message_filter.apply(data_set.texts(count))
+
+    # Parsing most of the data set again would be just as quick
+    if len(added) + len(removed) > len(data_set) // 2:
+        return None
+
+    try:
+        return update_compiled(previous, parse_messages(text_class, added, state_size),
+                               parse_messages(text_class, removed, state_size),
+                               training_metadata(data_set, message_filter, text_class, state_size))
+    except ValueError:
+        return None
+
+
+def convert_file(json_file_name, compiled_file_name):
+    """Converts a json model file, gzipped or not, to the compiled format"""
+    opener = gzip.open if json_file_name.endswith('.gz') else open
+    with opener(json_file_name, 'rb') as f:
+        compiled = convert_json(f.read())
+    with open(compiled_file_name, 'wb') as f:
+        f.write(compiled)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python -m lambdas.common.markov_model <model.json.gz> <model.dfmm>')
+        sys.exit(1)
+    convert_file(sys.argv[1], sys.argv[2])
@@ -0,0 +1,98 @@
+"""Removes the messages that contain any of a subject's text filters.
+
+A handful of filters is checked with str's own substring search. Larger filter sets are compiled once into an
+Aho-Corasick automaton, a trie of the filters with links from each node to the longest suffix that is also in the trie,
+so every message is scanned a single time however many filters there are.
+"""
+from collections import deque
+
+# Below this many filters checking each one with `in` is quicker than walking the automaton in Python
+MIN_AUTOMATON_FILTERS = 80
+
+
+class MessageFilter:
+    """Compiled set of text filters. A message is filtered if any filter appears anywhere in it."""
+    def __init__(self, filters):
+        # An empty filter would match everything. A subject without filters is sent to the lambdas as [''].
+        self.filters = list(dict.fromkeys(f for f in filters if f))
+        self.goto = None
+        self.fail = None
+        self.terminal = None
+
+        # Counts of the texts passed through apply()
+        self.checked = 0
+        self.kept = 0
+        if len(self.filters) >= MIN_AUTOMATON_FILTERS:
+            self._compile()
+
+    def __len__(self):
+        return len(self.filters)
+
+    def _compile(self):
+        # Trie of the filters. Node 0 is the root.
+        goto, terminal = [{}], [False]
+        for f in self.filters:
+            node = 0
+            for c in f:
+                child = goto[node].get(c)
+                if child is None:
+                    child = goto[node][c] = len(goto)
+                    goto.append({})
+                    terminal.append(False)
+                node = child
+            terminal[node] = True
+
+        # Failure links, breadth first so a node's parent is always done before the node. A node is terminal if any
+        # suffix of it is, i.e. if reaching it means a filter has been seen.
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(c, 0) if node else 0
+                terminal[child] = terminal[child] or terminal[fail[child]]
+
+        self.goto, self.fail, self.terminal = goto, fail, terminal
+
+    def matches(self, text):
+        """Returns True if the text contains any of the filters"""
+        if self.goto is None:
+            return any((f in text) for f in self.filters)
+
+        goto, fail, terminal = self.goto, self.fail, self.terminal
+        node = 0
+        for c in text:
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            if terminal[node]:
+                return True
+        return False
+
+    def apply(self, texts):
+        """Yields the texts that don't contain any of the filters. Texts are read one at a time as they're needed."""
+        if not self.filters:
+            for text in texts:
+                self.checked += 1
+                self.kept += 1
+                yield text
+        elif self.goto is None:
+            filters = self.filters
+            for text in texts:
+                self.checked += 1
+                for f in filters:
+                    if f in text:
+                        break
+                else:
+                    self.kept += 1
+                    yield text
+        else:
+            for text in texts:
+                self.checked += 1
+                if not self.matches(text):
+                    self.kept += 1
+                    yield text
@@ -0,0 +1,246 @@
+"""Artifact stores shared by the bot and the lambda functions. Data sets, models and plots are kept in our S3 bucket, a
+local folder standing in for it, or memory for tests and benchmarks. Every store has the same methods:
+
+    open(key)                           readable stream of an object
+    read(key) / read_range(key, a, b)   an object or bytes a to b - 1 of it
+    write(key, data)                    replaces an object
+    download_file(key, file_name) / upload_file(file_name, key)
+    start_upload, upload_part, complete_upload, abort_upload
+                                        multipart uploads for writing an object in pieces, see
+                                        cogs/object_store.StreamingUpload
+
+Reading a key that doesn't exist raises ArtifactNotFound. S3 clients are shared by every store with the same
+credentials so their connection pool is reused.
+"""
+import io
+import os
+import uuid
+import shutil
+import threading
+
+BUCKET_NAME = 'deepfake-discord-bot'
+
+# Connections each S3 client keeps open. Streaming uploads and lambda results are read and written from a thread pool.
+MAX_POOL_CONNECTIONS = 32
+
+# Text results up to this size are returned in the function's response instead of going through the bucket. Responses
+# can be up to 6 MB.
+MAX_INLINE_SIZE = 256 * 1024
+
+# Folder the handlers download to and draw in. Every Lambda function has a /tmp of its own, but handlers run by the
+# bot's worker processes share this machine's, so the bot gives each invocation its own folder in the event.
+TMP_FOLDER = '/tmp'
+
+
+class ArtifactNotFound(FileNotFoundError):
+    """Raised when reading a key that isn't in the store"""
+    pass
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def s3_client(aws_access_key_id=None, aws_secret_access_key=None):
+    """Returns the shared client for a set of credentials. boto3 picks up the Lambda function's role if none are
+    given."""
+    with clients_lock:
+        key = (aws_access_key_id, aws_secret_access_key)
+        if key not in clients:
+            import boto3
+            import botocore.config
+            clients[key] = boto3.client('s3', aws_access_key_id=aws_access_key_id,
+                                        aws_secret_access_key=aws_secret_access_key,
+                                        config=botocore.config.Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+        return clients[key]
+
+
+class S3ObjectStore:
+    """Stores artifacts in our S3 bucket"""
+    def __init__(self, bucket=BUCKET_NAME, aws_access_key_id=None, aws_secret_access_key=None):
+        self.bucket = bucket
+        self.client = s3_client(aws_access_key_id, aws_secret_access_key)
+
+    def _get(self, key, **kwargs):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise ArtifactNotFound(key)
+
+    def open(self, key):
+        return self._get(key)
+
+    def read(self, key):
+        body = self._get(key)
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def read_range(self, key, start, end):
+        if end <= start:
+            return b''
+        body = self._get(key, Range=f'bytes={start}-{end - 1}')
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def write(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def download_file(self, key, file_name):
+        import botocore.exceptions
+        try:
+            self.client.download_file(self.bucket, key, file_name)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ['404', 'NoSuchKey']:
+                raise ArtifactNotFound(key)
+            raise
+
+    def upload_file(self, file_name, key):
+        self.client.upload_file(file_name, self.bucket, key)
+
+    def start_upload(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key, upload_id, part_number, data):
+        response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                           PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def complete_upload(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+
+    def abort_upload(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalObjectStore:
+    """Stores artifacts in a local folder. Stands in for S3 when testing or running without AWS."""
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def open(self, key):
+        try:
+            return open(self.path(key), 'rb')
+        except FileNotFoundError:
+            raise ArtifactNotFound(key)
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def read_range(self, key, start, end):
+        with self.open(key) as f:
+            f.seek(start)
+            return f.read(max(end - start, 0))
+
+    def write(self, key, data):
+        with open(self.path(key), 'wb') as f:
+            f.write(data)
+
+    def download_file(self, key, file_name):
+        try:
+            shutil.copyfile(self.path(key), file_name)
+        except FileNotFoundError:
+            raise ArtifactNotFound(key)
+
+    def upload_file(self, file_name, key):
+        shutil.copyfile(file_name, self.path(key))
+
+    def start_upload(self, key):
+        return str(uuid.uuid4().hex)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with open(self.path(f'{key}.{upload_id}.{part_number}'), 'wb') as f:
+            f.write(data)
+        return {'PartNumber': part_number}
+
+    def complete_upload(self, key, upload_id, parts):
+        with open(self.path(key), 'wb') as f:
+            for part in parts:
+                part_file_name = self.path(f'{key}.{upload_id}.{part["PartNumber"]}')
+                with open(part_file_name, 'rb') as p:
+                    shutil.copyfileobj(p, f)
+                os.remove(part_file_name)
+
+    def abort_upload(self, key, upload_id):
+        for file_name in os.listdir(self.root):
+            if file_name.startswith(f'{key}.{upload_id}.'):
+                os.remove(self.path(file_name))
+
+
+class MemoryObjectStore:
+    """Keeps artifacts in a dict. For tests and for benchmarking without a network or disk."""
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def read(self, key):
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise ArtifactNotFound(key)
+
+    def open(self, key):
+        return io.BytesIO(self.read(key))
+
+    def read_range(self, key, start, end):
+        return self.read(key)[start:max(end, start)]
+
+    def write(self, key, data):
+        self.objects[key] = bytes(data)
+
+    def download_file(self, key, file_name):
+        with open(file_name, 'wb') as f:
+            f.write(self.read(key))
+
+    def upload_file(self, file_name, key):
+        with open(file_name, 'rb') as f:
+            self.write(key, f.read())
+
+    def start_upload(self, key):
+        upload_id = str(uuid.uuid4().hex)
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with self.lock:
+            self.uploads[upload_id][part_number] = bytes(data)
+        return {'PartNumber': part_number}
+
+    def complete_upload(self, key, upload_id, parts):
+        uploaded = self.uploads.pop(upload_id)
+        self.write(key, b''.join(uploaded[part['PartNumber']] for part in parts))
+
+    def abort_upload(self, key, upload_id):
+        self.uploads.pop(upload_id, None)
+
+
+def get_object_store():
+    """Returns the store picked with the same environment variables as cogs/config.py. The bot passes its own settings
+    to the worker processes that run the handlers locally."""
+    if os.environ.get('DEEPFAKE_ARTIFACT_STORE', 's3') == 'local':
+        return LocalObjectStore(os.environ.get('DEEPFAKE_LOCAL_ARTIFACT_PATH', './tmp/artifacts'))
+    else:
+        return S3ObjectStore()
+
+
+def tmp_folder(event):
+    """The folder a handler should keep its files in"""
+    return event.get('tmp_folder', TMP_FOLDER)
+
+
+def put_result(store, response, file_name, text):
+    """Adds a text result to a function's response under 'inline', or uploads it as file_name if it's too big"""
+    if len(text.encode('utf-8')) <= MAX_INLINE_SIZE:
+        response.setdefault('inline', {})[file_name] = text
+    else:
+        store.write(file_name, text.encode('utf-8'))
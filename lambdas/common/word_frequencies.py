@@ -0,0 +1,51 @@
+"""Counts the words in a stream of messages for the word clouds.
+
+Messages are read in chunks that are joined into one string, so a chunk is lowercased and split on whitespace with a
+single call and its words go straight into a Counter, which counts in C. Stopwords are removed afterwards from the
+distinct words rather than checked for every word read, and only the most common words are kept since a cloud can't
+draw more than a couple of hundred.
+"""
+import heapq
+from collections import Counter
+from itertools import islice
+
+# Words drawn in a cloud. WordCloud's own default.
+MAX_WORDS = 200
+
+# Messages joined into each chunk
+CHUNK_SIZE = 10000
+
+
+def read_chunks(texts, lower=False, size=CHUNK_SIZE):
+    """Yields the texts joined into strings of up to `size` texts, one text per line. Texts are read as they're
+    needed."""
+    texts = iter(texts)
+    while True:
+        batch = list(islice(texts, size))
+        if not batch:
+            return
+        chunk = '\n'.join(batch)
+        yield chunk.lower() if lower else chunk
+
+
+def count_words(texts, lower=False, vocabulary=None):
+    """Returns a Counter of the words in texts. If a vocabulary is given only the words in it are counted."""
+    counts = Counter()
+    for chunk in read_chunks(texts, lower):
+        words = chunk.split()
+        counts.update(words if vocabulary is None else filter(vocabulary.__contains__, words))
+    return counts
+
+
+def top_words(counts, max_words=MAX_WORDS, stopwords=None):
+    """Keeps the max_words most common words. Words whose lowercase form is a stopword are dropped."""
+    words = counts.keys()
+    if stopwords:
+        words = [word for word in words if word.lower() not in stopwords]
+    return dict(heapq.nlargest(max_words, ((word, counts[word]) for word in words), key=lambda item: item[1]))
+
+
+def word_frequencies(texts, max_words=MAX_WORDS, stopwords=None, lower=False, vocabulary=None):
+    """Counts the words in texts and keeps the most common ones, ready for WordCloud.generate_from_frequencies"""
+    return top_words(count_words(texts, lower, vocabulary), max_words, stopwords)
+
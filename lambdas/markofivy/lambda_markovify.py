@@ -1,6 +1,9 @@
 import markovify
-import boto3
 import gzip
+from lambdas.common import dataset
+from lambdas.common import message_filter
+from lambdas.common import markov_model
+from lambdas.common import storage
 
 UNIQUE_DELIMITER = '11a4b96a-ae8a-45f9-a4db-487cda63f5bd'
 
@@ -14,69 +17,68 @@ def lambda_handler(event, context):
     state_size = event['state_size']
     number_responses = event['number_responses']
 
-    # Download the data set from S3
-    text_file_name = f'{data_uid}-text.dsv.gz'
-    aws_s3_bucket_prefix = 'deepfake-discord-bot'
-    s3 = boto3.resource('s3')
-    s3.Bucket(aws_s3_bucket_prefix) \
-        .download_file(text_file_name, '/tmp/' + text_file_name)
-
-    # Decompress
-    with open('/tmp/' + text_file_name, 'rb') as f:
-        g = gzip.GzipFile(fileobj=f)
-        content = g.read().decode(). \
-            split(UNIQUE_DELIMITER)
-
-    # Apply filters
-    if filters == ['']:
-        filtered_content = content
-    else:
-        filtered_content = []
-        for i in content:
-            include = True
-            for j in filters:
-                if j in i:
-                    include = False
-                    break
-            if include:
-                filtered_content.append(i)
-
-    # Generate the model
-    if new_line:
-        text_model = markovify.NewlineText('\n'.join(filtered_content),
-                                           state_size=state_size)
-    else:
-        text_model = markovify.Text('\n'.join(filtered_content),
-                                    state_size=state_size)
+    previous_model_uid = event.get('previous_model_uid')
+
+    # Download the data set. Indexed data sets are memory mapped and read one message at a time.
+    store = storage.get_object_store()
+    folder = storage.tmp_folder(event)
+    data_set = dataset.open_data_set(data_uid, store.download_file, folder)
+    matcher = message_filter.MessageFilter(filters)
+    text_class = markovify.NewlineText if new_line else markovify.Text
+
+    metadata = None
+    if isinstance(data_set, dataset.DataSetReader):
+        metadata = markov_model.training_metadata(data_set, matcher, text_class, state_size)
+
+    # Update the subject's previous model if only part of the data set needs parsing. Only newline separated models
+    # can be updated...
+    compiled = None
+    if previous_model_uid and metadata is not None and new_line:
+        compiled = update_model(store, previous_model_uid, data_set, matcher, text_class, state_size, folder)
+
+    # ...otherwise generate the model from every message. Only the messages that are kept are held in memory.
+    if compiled is None:
+        filtered_content = list(matcher.apply(data_set.texts()))
+        text_model = text_class('\n'.join(filtered_content), state_size=state_size)
+        compiled = markov_model.compile_text(text_model, metadata)
+    model = markov_model.CompiledModel(compiled)
 
     # Generate responses
-    responses = []
-    for i in range(number_responses):
-        responses.append(str(text_model.make_sentence(tries=100)))
+    responses = [str(sentence) for sentence in model.make_sentences(number_responses, tries=100)]
     if len(responses) > 1:
         result = UNIQUE_DELIMITER.join(responses)
     else:
         result = 'Failed :('
 
-    # Write results to compressed file
+    # Upload the model compressed...
     model_file_name = f'{model_uid}-markov-model.json.gz'
-    with gzip.open(f'/tmp/{model_file_name}', 'wb') as f:
-        f.write(text_model.to_json().encode())
+    store.write(model_file_name, gzip.compress(markov_model.to_json(model).encode(), compresslevel=6))
 
-    # Write sample responses to file
-    sample_repsonse_file_name = f'{model_uid}-sample-responses.txt'
-    with open(f'/tmp/{sample_repsonse_file_name}', 'w', encoding='utf-8') as f:
-        f.write(result)
+    # ...and in the compiled format, which loads without parsing the chain
+    store.write(markov_model.model_file_name(model_uid), compiled)
 
-    # Upload to S3
-    s3.Object(aws_s3_bucket_prefix, model_file_name) \
-        .upload_file(f'/tmp/{model_file_name}')
-
-    s3.Object(aws_s3_bucket_prefix, sample_repsonse_file_name) \
-        .upload_file(f'/tmp/{sample_repsonse_file_name}')
-
-    return {
+    response = {
         'statusCode': 200,
-        'body': responses,
         'model_uid': model_uid
     }
+
+    # Sample responses are usually small enough to send back with the response. Bigger ones are only uploaded, since
+    # a response can't be more than 6 MB.
+    storage.put_result(store, response, f'{model_uid}-sample-responses.txt', result)
+    return response
+
+
+def update_model(store, previous_model_uid, data_set, matcher, text_class, state_size, folder=storage.TMP_FOLDER):
+    """Folds the messages that changed since a previous model was generated into it. Returns the compiled model or
+    None if it needs generating from scratch."""
+    compiled_model_file_name = markov_model.model_file_name(previous_model_uid)
+    try:
+        store.download_file(compiled_model_file_name, f'{folder}/{compiled_model_file_name}')
+    except Exception:
+        return None
+
+    previous = markov_model.CompiledModel.open(f'{folder}/{compiled_model_file_name}')
+    try:
+        return markov_model.update_model(previous, data_set, matcher, text_class, state_size)
+    finally:
+        previous.close()
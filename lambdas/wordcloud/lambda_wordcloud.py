@@ -1,8 +1,11 @@
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud, STOPWORDS
-import multidict as multidict
-import boto3
-import gzip
+from collections import Counter
+import os
+from lambdas.common import dataset
+from lambdas.common import message_filter
+from lambdas.common import word_frequencies
+from lambdas.common import storage
 import json
 
 
@@ -13,123 +16,112 @@ def lambda_handler(event, context):
     wordcloud_file_name = event['wordcloud_file_name']
     dirty = event['dirty']
 
-    # Download the data set from S3
-    text_file_name = f'{data_uid}-text.dsv.gz'
-    aws_s3_bucket_prefix = 'deepfake-discord-bot'
-    s3 = boto3.resource('s3')
-    s3.Bucket(aws_s3_bucket_prefix) \
-        .download_file(text_file_name, '/tmp/' + text_file_name)
-
-    # Decompress
-    with open('/tmp/' + text_file_name, 'rb') as f:
-        g = gzip.GzipFile(fileobj=f)
-        content = g.read().decode(). \
-            split('11a4b96a-ae8a-45f9-a4db-487cda63f5bd')
-
-    # Apply filters
-    if filters == ['']:
-        filtered_content = content
-    else:
-        filtered_content = []
-        for i in content:
-            include = True
-            for j in filters:
-                if j in i:
-                    include = False
-                    break
-            if include:
-                filtered_content.append(i)
+    # Download the data set from S3 and read it one message at a time
+    store = storage.get_object_store()
+    folder = storage.tmp_folder(event)
+    content = dataset.stream_texts(data_uid, store.download_file, folder)
+
+    # Apply filters. Messages are filtered as they're counted so the whole data set is never in memory.
+    matcher = message_filter.MessageFilter(filters)
+    filtered_content = matcher.apply(content)
 
     if dirty:
-        swears = generate_dirty(filtered_content, wordcloud_file_name)
+        swears = generate_dirty(filtered_content, wordcloud_file_name, folder)
         response = {
             'statusCode': 200,
             'swears': swears
         }
 
     else:
-        generate(filtered_content, wordcloud_file_name)
+        generate(filtered_content, wordcloud_file_name, folder)
         response = {
             'statusCode': 200,
-            'total_messages': len(content),
-            'filtered_messages': len(filtered_content)
+            'total_messages': matcher.checked,
+            'filtered_messages': matcher.kept
         }
 
     # Upload to S3
-    s3.Object(aws_s3_bucket_prefix, wordcloud_file_name) \
-        .upload_file(f'/tmp/{wordcloud_file_name}')
+    store.upload_file(f'{folder}/{wordcloud_file_name}', wordcloud_file_name)
 
-    # Upload the response to S3 as a .json file
+    # Add the counts to the response as a .json file
     response_file_name = wordcloud_file_name.replace('.png', '.json')
-    with open(f'/tmp/{response_file_name}', 'w') as f:
-        f.write(json.dumps(response))
-
-    s3.Object(aws_s3_bucket_prefix, response_file_name) \
-        .upload_file(f'/tmp/{response_file_name}')
+    storage.put_result(store, response, response_file_name, json.dumps(response))
 
     return response
 
 
-def get_frequency_dict(sentence):
-    """Converts raw text into a multidict for wordcloud usage"""
-    full_terms_dict = multidict.MultiDict()
-    tmp_dict = {}
+# Next to this file, so it's found whatever the working directory is
+SWEAR_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'swearWords.txt')
 
-    # making dict for counting frequencies
-    for text in sentence.split(" "):
-        if text.lower().strip() in STOPWORDS:
-            continue
-        val = tmp_dict.get(text, 0)
-        tmp_dict[text.strip()] = val + 1
-    for key in tmp_dict:
-        full_terms_dict.add(key, tmp_dict[key])
-    return full_terms_dict
+swear_word_lists = {}
 
 
-def generate_dirty(content, file_name):
-    """Makes a word cloud of swear words for a subject. No filters applied."""
-    content = ' '.join(content)
+def load_swear_words(path=SWEAR_WORDS_PATH):
+    """Reads the swear word list once per container. Returns the single words as a set and the few entries with spaces
+    in them as a list."""
+    if path not in swear_word_lists:
+        with open(path, 'r') as f:
+            entries = {' '.join(line.lower().split()) for line in f} - {''}
+        words = frozenset(entry for entry in entries if ' ' not in entry)
+        phrases = sorted(entries - words)
+        swear_word_lists[path] = words, phrases
+    return swear_word_lists[path]
 
-    swear_path = './resources/swearWords.txt'
-    with open(swear_path, 'r') as f:
-        swear_words = [i.strip() for i in f]
 
-        bad_language = ''
-        for s in swear_words:
-            bad_language = bad_language + (s + ' ') * content.lower().count(' ' + s + ' ')
-        if bad_language == '':
-            return False
+def count_swears(content, words, phrases=()):
+    """Counts the swear words in a single pass over the messages. Messages are lowercased and split into words a chunk
+    at a time, and every word is looked up in the set."""
+    counts = Counter()
+    for chunk in word_frequencies.read_chunks(content, lower=True):
+        counts.update(filter(words.__contains__, chunk.split()))
+        if phrases:
+            # Phrases need a space or the end of the message on each side, the same as a word
+            padded = ' ' + chunk.replace('\n', ' \n ') + ' '
+            for phrase in phrases:
+                n = padded.count(f' {phrase} ')
+                if n:
+                    counts[phrase] += n
+    return counts
+
+
+def generate_dirty(content, file_name, folder=storage.TMP_FOLDER):
+    """Makes a word cloud of swear words for a subject. No filters applied."""
+    counts = count_swears(content, *load_swear_words())
+    if not counts:
+        return False
 
     wc = WordCloud(background_color="black",
                    stopwords=STOPWORDS,
                    colormap='BrBG',
+                   max_words=word_frequencies.MAX_WORDS,
                    width=640,
                    height=480)
 
-    wc.generate_from_frequencies(get_frequency_dict(bad_language))
+    wc.generate_from_frequencies(word_frequencies.top_words(counts))
     fig = plt.figure(frameon=False)
     ax = plt.Axes(fig, [0., 0., 1., 1.])
     ax.set_axis_off()
     fig.add_axes(ax)
     ax.imshow(wc, interpolation='bilinear')
 
-    fig.savefig(f'/tmp/{file_name}')
+    fig.savefig(f'{folder}/{file_name}')
     return True
 
 
-def generate(selected_content, file_name):
+def generate(selected_content, file_name, folder=storage.TMP_FOLDER):
     """Makes a wordcloud of a user's messages with filters applied"""
     wc = WordCloud(background_color="black",
                    stopwords=STOPWORDS,
                    colormap='BrBG',
+                   max_words=word_frequencies.MAX_WORDS,
                    width=640,
                    height=480)
 
-    wc.generate_from_frequencies(get_frequency_dict(' '.join(selected_content)))
+    wc.generate_from_frequencies(word_frequencies.word_frequencies(selected_content, stopwords=STOPWORDS))
     fig = plt.figure(frameon=False)
     ax = plt.Axes(fig, [0., 0., 1., 1.])
     ax.set_axis_off()
     fig.add_axes(ax)
     ax.imshow(wc, interpolation='bilinear')
 
-    fig.savefig(f'/tmp/{file_name}')
+    fig.savefig(f'{folder}/{file_name}')
@@ -23,6 +23,8 @@ copyversion
 
 mkdir deploy
 cp -r cogs deploy
+mkdir deploy/lambdas
+cp -r lambdas/common deploy/lambdas
 cp -r tmp deploy
 cp bot.py deploy
 cp Dockerfile deploy
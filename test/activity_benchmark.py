@@ -0,0 +1,68 @@
+"""Compares the activity lambda's old day filling, which converted every timestamp with datetime.fromtimestamp and
+searched the active days once for each day in the range, with daily_counts. Histories are made like the ones in
+test/activity_plot_test.py, a random number of messages on most days, over several years. Run with
+PYTHONPATH=. python test/activity_benchmark.py"""
+import time
+import random
+import unittest
+from lambdas.activity.lambda_activity import *
+
+YEARS = [1, 3, 5]
+MESSAGES_PER_DAY = 50
+
+
+def make_history(rng, days):
+    start = dt.datetime.timestamp(dt.datetime(2015, 1, 1))
+    timestamps = []
+    for d in range(days):
+        # Leave some days empty so they have to be filled
+        if rng.random() < 0.2:
+            continue
+        ts = int(start + d * SECONDS_PER_DAY)
+        timestamps.extend(ts + rng.randrange(SECONDS_PER_DAY) for n in range(rng.randint(1, 2 * MESSAGES_PER_DAY)))
+    return pd.DataFrame({'timestamp': timestamps, 'channel': 'general'})
+
+
+def old_daily_counts(df):
+    df['datetime'] = df['timestamp'].apply(lambda t: dt.datetime.fromtimestamp(t))
+    df['date'] = df['datetime'].apply(lambda t: t.date())
+
+    ch_gb = df.groupby('date')
+    dates = ch_gb['date'].count().index.values
+    counts = ch_gb['timestamp'].count().values
+
+    filled_dates = []
+    filled_counts = []
+    for n in range(int((dates.max() - dates.min()).days) + 1):
+        single_date = dates.min() + dt.timedelta(n)
+        filled_dates.append(single_date)
+        if single_date in dates:
+            i = np.where(dates == single_date)
+            filled_counts.append(counts[i])
+        else:
+            filled_counts.append(0)
+
+    return filled_dates, filled_counts
+
+
+class ActivityBenchmark(unittest.TestCase):
+    def test_daily_counts(self):
+        rng = random.Random(0)
+        for years in YEARS:
+            df = make_history(rng, years * 365)
+
+            start = time.perf_counter()
+            expected_dates, expected_counts = old_daily_counts(df.copy())
+            old_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            dates, counts = daily_counts(df['timestamp'].values)
+            new_time = time.perf_counter() - start
+
+            self.assertEqual(int(counts.sum()), len(df))
+            self.assertEqual(len(dates), len(expected_dates))
+            print(f'\n{years} years, {len(df)} messages: day_filler {old_time:.2f}s, daily_counts {new_time:.4f}s')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,76 @@
-import unittest
-import gzip
-import random
-from lambdas.activity.lambda_activity import *
-
-
-class ActivityTest(unittest.TestCase):
-    def test_date_ranges(self):
-        """Tests activity plot function for different numbers of days"""
-        for i in range(1, 100):
-            with gzip.open(f'./tmp/{i}-test-channels.csv.gz', 'wb') as f:
-                f.write('timestamp,channel\n'.encode())
-                for t in range(i):
-                    ts = dt.datetime.timestamp(dt.datetime.now() + dt.timedelta(t))
-                    for n in range(int(random.random() * 10) + 1):
-                        line = f'{int(ts) + n},general\n'
-                        f.write(line.encode())
-
-            data_id = f'{i}-test'
-            image_uid = f'{i}-test'
-            user_name = 'test user'
-            time_series_chart(data_id, image_uid, user_name)
-
-
-if __name__ == '__main__':
-    unittest.main()
+import unittest
+import gzip
+import random
+import tempfile
+from lambdas.activity.lambda_activity import *
+from lambdas.common.dataset import DataSetWriter, data_file_name
+
+
+class ActivityTest(unittest.TestCase):
+    def test_date_ranges(self):
+        """Tests activity plot function for different numbers of days"""
+        for i in range(1, 100):
+            with gzip.open(f'./tmp/{i}-test-channels.csv.gz', 'wb') as f:
+                f.write('timestamp,channel\n'.encode())
+                for t in range(i):
+                    ts = dt.datetime.timestamp(dt.datetime.now() + dt.timedelta(t))
+                    for n in range(int(random.random() * 10) + 1):
+                        line = f'{int(ts) + n},general\n'
+                        f.write(line.encode())
+
+            data_id = f'{i}-test'
+            image_uid = f'{i}-test'
+            user_name = 'test user'
+            activity = Activity.load(data_id)
+            time_series_chart(activity, image_uid, user_name)
+
+    def test_daily_counts(self):
+        """Tests that days without messages are filled with 0's"""
+        day = 24 * 60 * 60
+        start = 1546300800
+        timestamps = [start + 5, start + 100, start + 3 * day + 7, start + day - 1]
+        dates, counts = daily_counts(timestamps)
+        self.assertEqual([str(d) for d in dates], ['2019-01-01', '2019-01-02', '2019-01-03', '2019-01-04'])
+        self.assertEqual(list(counts), [3, 0, 0, 1])
+
+    def test_activity_counts(self):
+        """Tests the counts every chart is drawn from"""
+        day = 24 * 60 * 60
+        hour = 60 * 60
+        # Tuesday 1 January 2019, midnight UTC
+        start = 1546300800
+        timestamps = [start + 5, start + 13 * hour, start + 2 * day + 13 * hour + 1, start + 6 * day + 23 * hour]
+        activity = Activity(timestamps, ['general', 'memes', 'general', 'art'])
+
+        self.assertEqual(list(activity.day_counts), [2, 0, 1, 0, 0, 0, 1])
+        self.assertEqual(list(activity.channels), ['art', 'general', 'memes'])
+        self.assertEqual(list(activity.channel_counts), [1, 2, 1])
+        self.assertEqual(list(activity.weekday_counts), [1, 2, 0, 1, 0, 0, 0])
+        self.assertEqual(activity.hour_counts[0], 1)
+        self.assertEqual(activity.hour_counts[13], 2)
+        self.assertEqual(activity.hour_counts[23], 1)
+        self.assertEqual(activity.date_range.days, 6)
+
+    def test_load_indexed(self):
+        """Tests that an indexed data set is counted from its columns the same as from every message's channel"""
+        rng = random.Random(0)
+        messages = [(f'message {i}', 1546300800 + rng.randrange(90 * 24 * 60 * 60), rng.choice(['memes', 'art']))
+                    for i in range(500)]
+        writer = DataSetWriter()
+        # A channel the subject didn't write in is left out of the chart
+        writer.channel_code('general')
+        with tempfile.TemporaryDirectory() as folder:
+            with open(f'{folder}/{data_file_name("data")}', 'wb') as f:
+                f.write(writer.header() + writer.encode(messages) + writer.footer())
+            activity = Activity.load('data', folder)
+
+        expected = Activity([timestamp for text, timestamp, channel in messages],
+                            [channel for text, timestamp, channel in messages])
+        self.assertEqual(list(activity.channels), ['art', 'memes'])
+        self.assertEqual(list(activity.channel_counts), list(expected.channel_counts))
+        self.assertEqual(list(activity.day_counts), list(expected.day_counts))
+        self.assertEqual(list(activity.hour_counts), list(expected.hour_counts))
+
+
+if __name__ == '__main__':
+    unittest.main()
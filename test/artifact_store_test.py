@@ -0,0 +1,99 @@
+import unittest
+import asyncio
+import tempfile
+import os
+from botocore.stub import Stubber
+from lambdas.common.storage import *
+from cogs.object_store import StreamingUpload
+
+
+class ArtifactStoreTests:
+    """Checks every store behaves the same way. Subclasses set up self.store."""
+    def test_write_and_read(self):
+        self.store.write('a', b'hello world')
+        self.assertEqual(self.store.read('a'), b'hello world')
+        with self.store.open('a') as f:
+            self.assertEqual(f.read(5), b'hello')
+
+    def test_read_range(self):
+        self.store.write('a', b'hello world')
+        self.assertEqual(self.store.read_range('a', 6, 11), b'world')
+        self.assertEqual(self.store.read_range('a', 3, 3), b'')
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with open(f'{folder}/in', 'wb') as f:
+                f.write(b'data')
+            self.store.upload_file(f'{folder}/in', 'a')
+            self.store.download_file('a', f'{folder}/out')
+            with open(f'{folder}/out', 'rb') as f:
+                self.assertEqual(f.read(), b'data')
+
+    def test_not_found(self):
+        for read in [self.store.read, self.store.open, lambda key: self.store.read_range(key, 0, 1),
+                     lambda key: self.store.download_file(key, os.devnull)]:
+            with self.assertRaises(ArtifactNotFound):
+                read('missing')
+
+    def test_streaming_upload(self):
+        async def run():
+            upload = StreamingUpload(self.store, 'stream', part_size=100)
+            await upload.start()
+            for i in range(10):
+                await upload.write(bytes([i]) * 50)
+            await upload.close()
+
+        asyncio.run(run())
+        self.assertEqual(self.store.read('stream'), b''.join(bytes([i]) * 50 for i in range(10)))
+
+
+class LocalObjectStoreTest(ArtifactStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+class MemoryObjectStoreTest(ArtifactStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryObjectStore()
+
+
+class S3ObjectStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = S3ObjectStore('bucket', 'key', 'secret')
+        self.stubber = Stubber(self.store.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_shared_client(self):
+        self.assertIs(S3ObjectStore('other', 'key', 'secret').client, self.store.client)
+
+    def test_not_found(self):
+        self.stubber.add_client_error('get_object', service_error_code='NoSuchKey', http_status_code=404)
+        with self.assertRaises(ArtifactNotFound):
+            self.store.read('missing')
+
+    def test_read_range(self):
+        self.stubber.add_client_error('get_object', service_error_code='InvalidRange', http_status_code=416,
+                                      expected_params={'Bucket': 'bucket', 'Key': 'a', 'Range': 'bytes=6-10'})
+        with self.assertRaises(self.store.client.exceptions.ClientError):
+            self.store.read_range('a', 6, 11)
+
+
+class PutResultTest(unittest.TestCase):
+    def test_inline_or_stored(self):
+        store = MemoryObjectStore()
+        response = {}
+        put_result(store, response, 'small.txt', 'hi')
+        put_result(store, response, 'big.txt', 'x' * (MAX_INLINE_SIZE + 1))
+        self.assertEqual(response['inline'], {'small.txt': 'hi'})
+        self.assertEqual(store.read('big.txt'), b'x' * (MAX_INLINE_SIZE + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+from cogs.extract_task import find_accessible_channels
+
+
+class FakeChannel:
+    def __init__(self, name, permissions=None, probe_error=None):
+        self.name = name
+        self.permissions = permissions
+        self.probe_error = probe_error
+        self.probed = False
+
+    def permissions_for(self, member):
+        if self.permissions is None:
+            raise RuntimeError('Permissions not cached')
+        read_messages, read_message_history = self.permissions
+        return SimpleNamespace(read_messages=read_messages, read_message_history=read_message_history)
+
+    async def history(self, limit=None):
+        self.probed = True
+        if self.probe_error:
+            raise Exception(self.probe_error)
+        yield SimpleNamespace(content='hi')
+
+
+class ChannelPermissionsTest(unittest.TestCase):
+    def test_cached_permissions(self):
+        channels = [FakeChannel('a', (True, True)), FakeChannel('b', (True, False)), FakeChannel('c', (False, True)),
+                    SimpleNamespace(name='voice')]
+        guild = SimpleNamespace(channels=channels, me=object())
+        accessible, unreadable = asyncio.run(find_accessible_channels(guild))
+        self.assertEqual([c.name for c in accessible], ['a'])
+        self.assertEqual(unreadable, ['b', 'c'])
+        self.assertFalse(any(c.probed for c in channels[:3]))
+
+    def test_probe_unclear_channels(self):
+        channels = [FakeChannel('a'), FakeChannel('b', probe_error='403 Forbidden'), FakeChannel('c', (True, True)),
+                    FakeChannel('d', probe_error='500 Internal Server Error')]
+        guild = SimpleNamespace(channels=channels, me=object())
+        accessible, unreadable = asyncio.run(find_accessible_channels(guild))
+        self.assertEqual([c.name for c in accessible], ['a', 'c'])
+        self.assertEqual(unreadable, ['b'])
+        self.assertEqual([c.probed for c in channels], [True, True, False, True])
+
+    def test_no_cached_member(self):
+        channels = [FakeChannel('a', (False, False))]
+        guild = SimpleNamespace(channels=channels, me=None)
+        accessible, unreadable = asyncio.run(find_accessible_channels(guild))
+        self.assertEqual([c.name for c in accessible], ['a'])
+        self.assertTrue(channels[0].probed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,21 @@ class CommonPrefixesTest(unittest.TestCase):
         expected_result = ['df!']
         self.assertEquals(common_prefixes, expected_result)
 
+    def test_most_used_first(self):
+        counter = CommandPrefixCounter(['!play', 'df!help', 'df!generate', 'pls help', '>>roll'])
+        counter.add_messages(['>>roll d20', 'just chatting', '>>roll 2d6', 'hello!'])
+        self.assertEqual(counter.most_common(2), ['>', 'df!'])
+        self.assertEqual(counter.most_common(), ['>', 'df!', '!', 'pls help'])
+
+    def test_merge(self):
+        a, b = CommandPrefixCounter(['df!help']), CommandPrefixCounter(['?ban', '?kick'])
+        a.merge(b)
+        self.assertEqual(a.most_common(1), ['?'])
+
+    def test_contained_prefix_skipped(self):
+        counter = CommandPrefixCounter(['!play', '!skip', 'a!help'])
+        self.assertEqual(counter.most_common(), ['!'])
+
 
 if __name__ == '__main__':
     unittest.main()
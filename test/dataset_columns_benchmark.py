@@ -0,0 +1,86 @@
+"""Compares keeping the timestamp and channel columns of an extraction in lists and writing the channels csv a row at a
+time against the typed arrays and bulk writes used by DataSetWriter. Run with
+PYTHONPATH=. python test/dataset_columns_benchmark.py"""
+import io
+import gzip
+import time
+import unittest
+from types import SimpleNamespace
+import tracemalloc
+from array import array
+from lambdas.common.dataset import *
+
+CHANNELS = 40
+MESSAGES_PER_CHANNEL = 12500
+
+
+def channel_timestamps(c):
+    return range(1500000000 + c * MESSAGES_PER_CHANNEL, 1500000000 + (c + 1) * MESSAGES_PER_CHANNEL)
+
+
+def list_columns():
+    timestamps, channel_names = [], []
+    for c in range(CHANNELS):
+        name = f'channel-{c}'
+        for timestamp in channel_timestamps(c):
+            timestamps.append(timestamp)
+            channel_names.append(name)
+    return timestamps, channel_names
+
+
+def list_csv(timestamps, channel_names):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        f.write('timestamp,channel\n'.encode())
+        for timestamp, channel in zip(timestamps, channel_names):
+            f.write(f'{timestamp},{channel}\n'.encode())
+    return buffer.getvalue()
+
+
+def array_columns():
+    writer = DataSetWriter()
+    writer.header()
+    texts = [''] * MESSAGES_PER_CHANNEL
+    for c in range(CHANNELS):
+        timestamps = array('q')
+        for timestamp in channel_timestamps(c):
+            timestamps.append(timestamp)
+        writer.encode_channel(texts, timestamps, f'channel-{c}')
+    return SimpleNamespace(timestamps=writer.timestamps, channel_codes=writer.channel_codes,
+                           channels=list(writer.channels))
+
+
+def measure(f, *args):
+    """Returns f's result, the seconds it took and the size of the result in bytes. Sizes are measured on a second run
+    because tracemalloc slows everything down."""
+    start = time.perf_counter()
+    result = f(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    retained = f(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+    return result, elapsed, size
+
+
+class DataSetColumnsBenchmark(unittest.TestCase):
+    def test_columns(self):
+        (timestamps, channel_names), list_time, list_size = measure(list_columns)
+        list_file, list_csv_time, _ = measure(list_csv, timestamps, channel_names)
+        del timestamps, channel_names
+
+        reader, array_time, array_size = measure(array_columns)
+        array_file, array_csv_time, _ = measure(export_channels, reader)
+
+        self.assertEqual(gzip.decompress(list_file), gzip.decompress(array_file))
+        print(f'\n{CHANNELS * MESSAGES_PER_CHANNEL} messages')
+        print(f'lists:  {list_size / 2**20:.1f} MB built in {list_time:.3f}s, '
+              f'csv written in {list_csv_time:.3f}s')
+        print(f'arrays: {array_size / 2**20:.1f} MB built and encoded in {array_time:.3f}s, '
+              f'csv written in {array_csv_time:.3f}s')
+
+
+if __name__ == '__main__':
+    unittest.main()
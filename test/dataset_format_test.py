@@ -0,0 +1,118 @@
+import unittest
+import io
+import gzip
+import tempfile
+from array import array
+from lambdas.common.dataset import *
+
+
+def make_messages(n):
+    return [(f'message {i} ✓', 1500000000 + i, f'channel-{i % 3}') for i in range(n)]
+
+
+def encode(messages):
+    writer = DataSetWriter()
+    return writer.header() + writer.encode(messages) + writer.footer()
+
+
+class DataSetFormatTest(unittest.TestCase):
+    def test_round_trip(self):
+        messages = make_messages(100)
+        reader = DataSetReader(encode(messages))
+        self.assertEqual(len(reader), 100)
+        self.assertEqual(list(reader.messages()), messages)
+        self.assertEqual(reader.channels, ['channel-0', 'channel-1', 'channel-2'])
+
+    def test_slice(self):
+        messages = make_messages(100)
+        reader = DataSetReader(encode(messages))
+        self.assertEqual(list(reader.texts(40, 45)), [m[0] for m in messages[40:45]])
+        self.assertEqual(reader.text(99), messages[99][0])
+
+    def test_empty(self):
+        reader = DataSetReader(encode([]))
+        self.assertEqual(len(reader), 0)
+        self.assertEqual(list(reader.messages()), [])
+
+    def test_written_in_pieces(self):
+        messages = make_messages(10)
+        writer = DataSetWriter()
+        data = writer.header()
+        for m in messages:
+            data += writer.encode([m])
+        data += writer.footer()
+        self.assertEqual(data, encode(messages))
+
+    def test_encode_channel(self):
+        messages = make_messages(30)
+        writer = DataSetWriter()
+        data = writer.header()
+        for channel in ['channel-0', 'channel-1', 'channel-2']:
+            texts = [m[0] for m in messages if m[2] == channel]
+            timestamps = array('q', [m[1] for m in messages if m[2] == channel])
+            data += writer.encode_channel(texts, timestamps, channel)
+        data += writer.footer()
+        self.assertEqual(data, encode(sorted(messages, key=lambda m: m[2])))
+
+        with self.assertRaises(ValueError):
+            writer.encode_channel(['a'], array('q'), 'channel-0')
+
+    def test_export_channels(self):
+        messages = make_messages(10)
+        reader = DataSetReader(encode(messages))
+        channels = gzip.decompress(export_channels(reader)).decode()
+        self.assertEqual(channels, 'timestamp,channel\n' + ''.join(f'{m[1]},{m[2]}\n' for m in messages))
+
+    def test_memory_map(self):
+        messages = make_messages(1000)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(encode(messages))
+            f.flush()
+            reader = DataSetReader.open(f.name)
+            self.assertEqual(list(reader.messages()), messages)
+            reader.close()
+
+    def test_stream(self):
+        messages = make_messages(100)
+        self.assertEqual(list(iter_texts(io.BytesIO(encode(messages)))), [m[0] for m in messages])
+
+    def test_legacy(self):
+        messages = make_messages(10)
+        text = ''.join(m[0] + UNIQUE_DELIMITER for m in messages)
+        channels = 'timestamp,channel\n' + ''.join(f'{m[1]},{m[2]}\n' for m in messages)
+        reader = LegacyDataSetReader(text, channels)
+        self.assertEqual(list(reader.messages()), messages)
+
+    def test_load_either_format(self):
+        messages = make_messages(10)
+        new = {data_file_name('new'): encode(messages)}
+        reader = DataSetReader(new[data_file_name('new')])
+        old = {'old-text.dsv.gz': export_text(reader), 'old-channels.csv.gz': export_channels(reader)}
+        self.assertEqual(list(load_data_set('new', new.__getitem__).messages()), messages)
+        self.assertEqual(list(load_data_set('old', old.__getitem__).messages()), messages)
+
+    def test_stream_delimited(self):
+        texts = ['short', 'a much longer message that spans chunks ✓', '', 'last']
+        stream = io.StringIO(''.join(t + UNIQUE_DELIMITER for t in texts))
+        self.assertEqual(list(iter_delimited(stream, chunk_size=7)), texts)
+
+    def test_stream_either_format(self):
+        messages = make_messages(10)
+        reader = DataSetReader(encode(messages))
+        files = {data_file_name('new'): encode(messages), 'old-text.dsv.gz': export_text(reader)}
+
+        def download(key, file_name):
+            with open(file_name, 'wb') as f:
+                f.write(files[key])
+
+        with tempfile.TemporaryDirectory() as folder:
+            for data_uid in ['new', 'old']:
+                self.assertEqual(list(stream_texts(data_uid, download, folder)), [m[0] for m in messages])
+
+    def test_not_a_data_set(self):
+        with self.assertRaises(ValueError):
+            DataSetReader(gzip.compress(b'hello'))
+
+
+if __name__ == '__main__':
+    unittest.main()
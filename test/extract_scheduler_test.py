@@ -0,0 +1,92 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+from cogs.extract_scheduler import *
+
+
+def make_ctx(user_id, guild_id, sent):
+    async def send(msg):
+        sent.append(msg)
+    return SimpleNamespace(author=SimpleNamespace(id=user_id), guild=SimpleNamespace(id=guild_id), send=send)
+
+
+class ExtractionSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.started = []
+
+    async def job(self, name, release):
+        self.started.append(name)
+        await release.wait()
+
+    def test_limit_and_round_robin(self):
+        async def run():
+            scheduler = ExtractionScheduler(max_running=1)
+            release = asyncio.Event()
+            positions = [
+                scheduler.submit(make_ctx(1, 'a', self.sent), self.job(1, release)),
+                scheduler.submit(make_ctx(2, 'a', self.sent), self.job(2, release)),
+                scheduler.submit(make_ctx(3, 'a', self.sent), self.job(3, release)),
+                scheduler.submit(make_ctx(4, 'b', self.sent), self.job(4, release)),
+            ]
+            self.assertEqual(positions, [0, 1, 2, 2])
+            self.assertEqual(scheduler.position(2), 1)
+            self.assertEqual(scheduler.position(3), 3)
+            self.assertEqual(scheduler.statistics(), {'Extraction tasks in progress': 1,
+                                                      'Extraction tasks queued': 3})
+            release.set()
+            while scheduler.jobs:
+                await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(self.started, [1, 2, 4, 3])
+
+    def test_one_job_per_user(self):
+        async def run():
+            scheduler = ExtractionScheduler(max_running=1)
+            release = asyncio.Event()
+            scheduler.submit(make_ctx(1, 'a', self.sent), self.job(1, release))
+            self.assertTrue(scheduler.has_job(1))
+            with self.assertRaises(ValueError):
+                scheduler.submit(make_ctx(1, 'a', self.sent), self.job(1, release))
+            release.set()
+            while scheduler.jobs:
+                await asyncio.sleep(0)
+            self.assertFalse(scheduler.has_job(1))
+
+        asyncio.run(run())
+
+    def test_cancel(self):
+        async def run():
+            scheduler = ExtractionScheduler(max_running=1)
+            release = asyncio.Event()
+            scheduler.submit(make_ctx(1, 'a', self.sent), self.job(1, release))
+            scheduler.submit(make_ctx(2, 'b', self.sent), self.job(2, release))
+            await asyncio.sleep(0)
+            self.assertTrue(scheduler.cancel(2))
+            self.assertTrue(scheduler.cancel(1))
+            self.assertFalse(scheduler.cancel(3))
+            while scheduler.jobs:
+                await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(self.started, [1])
+
+    def test_failure_reported(self):
+        async def fail():
+            raise RuntimeError('oops')
+
+        async def run():
+            scheduler = ExtractionScheduler(max_running=1)
+            scheduler.submit(make_ctx(1, 'a', self.sent), fail())
+            while scheduler.jobs:
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(len(self.sent), 1)
+        self.assertTrue(self.sent[0].startswith('Sorry, your extraction task failed.'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+import unittest
+import asyncio
+import datetime as dt
+from types import SimpleNamespace
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from cogs.db_schema import *
+from cogs import db_queries
+from cogs import extract_task
+from cogs.core_commands import CoreCommands
+from cogs.object_store import MemoryObjectStore
+from lambdas.common import dataset
+
+READABLE = SimpleNamespace(read_messages=True, read_message_history=True)
+
+
+def make_message(message_id, author_id):
+    created_at = dt.datetime.fromtimestamp(1546300800 + message_id, dt.timezone.utc)
+    return SimpleNamespace(id=message_id, author=SimpleNamespace(id=author_id), content=f'message {message_id}',
+                           created_at=created_at)
+
+
+class ReadCounter:
+    """Keeps track of how many channel histories are being read at once"""
+    def __init__(self):
+        self.reading = 0
+        self.most_reading = 0
+
+
+class FakeChannel:
+    """Text channel with a history of (message id, author id) pairs. Like Discord, a full history is read newest first
+    and one read after a message oldest first."""
+    def __init__(self, channel_id, messages, counter, delay=0.0, fail_after=None):
+        self.id = channel_id
+        self.name = f'channel-{channel_id}'
+        self.messages = [make_message(message_id, author_id) for message_id, author_id in messages]
+        self.counter = counter
+        self.delay = delay
+        self.fail_after = fail_after
+        self.reads = []
+
+    def permissions_for(self, member):
+        return READABLE
+
+    async def history(self, limit=None, after=None):
+        self.reads.append(after.id if after else None)
+        if after:
+            messages = sorted((m for m in self.messages if m.id > after.id), key=lambda m: m.id)
+        else:
+            messages = sorted(self.messages, key=lambda m: m.id, reverse=True)
+
+        self.counter.reading += 1
+        self.counter.most_reading = max(self.counter.most_reading, self.counter.reading)
+        try:
+            for i, message in enumerate(messages[:limit]):
+                if i == self.fail_after:
+                    raise RuntimeError('503 Service Unavailable')
+                await asyncio.sleep(self.delay)
+                yield message
+        finally:
+            self.counter.reading -= 1
+
+
+class ExtractTaskTest(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryObjectStore()
+        self.counter = ReadCounter()
+        self.sent = []
+        self.data_sets = {}
+        self.checkpoints = {}
+
+    def make_ctx(self, channels):
+        async def send(msg, files=None):
+            self.sent.append(msg)
+
+        guild = SimpleNamespace(id=1, name='server', channels=channels, me=object())
+        author = SimpleNamespace(id=100, send=send)
+        message = SimpleNamespace(guild=guild, author=author, channel=SimpleNamespace(name='general'))
+        return SimpleNamespace(message=message, guild=guild, author=author, send=send, invoked_with='extract')
+
+    def make_bot(self):
+        async def wait_until_ready():
+            pass
+
+        return SimpleNamespace(loop=asyncio.get_event_loop(), wait_until_ready=wait_until_ready,
+                               get_cog=lambda name: SimpleNamespace(session=None))
+
+    def create_data_set(self, session, ctx, subject, uid, checkpoints=None):
+        self.data_sets[subject.id] = uid
+        self.checkpoints[uid] = dict(checkpoints or {})
+
+    def add_previous_data_set(self, uid, messages, checkpoints):
+        """Stores a data set as if an earlier extraction had made it"""
+        writer = dataset.DataSetWriter()
+        self.store.write(dataset.data_file_name(uid), writer.header() + writer.encode(messages) + writer.footer())
+        self.checkpoints[uid] = checkpoints
+
+    def extract(self, extractions, channels):
+        """Runs an extraction task against the fake channels. Returns the messages in each subject's data set, keyed by
+        subject id."""
+        async def run():
+            ctx = self.make_ctx(channels)
+            await extract_task.extract_chat_histories(ctx, extractions, self.make_bot())
+
+        with mock.patch.object(extract_task.object_store, 'get_object_store', return_value=self.store), \
+                mock.patch.object(extract_task.db_queries, 'create_data_set', side_effect=self.create_data_set), \
+                mock.patch.object(extract_task.db_queries, 'add_multiple_filters', return_value=[]), \
+                mock.patch.object(extract_task.db_queries, 'get_channel_checkpoints',
+                                  side_effect=lambda session, uid: dict(self.checkpoints[uid])):
+            asyncio.run(run())
+
+        results = {}
+        for extraction in extractions:
+            reader = dataset.DataSetReader(self.store.read(dataset.data_file_name(extraction.extraction_id)))
+            results[extraction.subject.id] = list(reader.messages())
+        return results
+
+    def test_concurrent_channels(self):
+        """Tests that channels are read a few at a time but written out in the order they were found"""
+        # Later channels finish first
+        channels = [FakeChannel(i, [(10 * i + n + 1, 1) for n in range(3)], self.counter, delay=0.02 * (4 - i))
+                    for i in range(4)]
+        subject = SimpleNamespace(id=1, name='subject')
+
+        with mock.patch.object(extract_task, 'MAX_CONCURRENT_CHANNELS', 2):
+            results = self.extract([extract_task.SubjectExtraction(subject)], channels)
+
+        self.assertEqual(self.counter.most_reading, 2)
+        self.assertEqual([channel for text, timestamp, channel in results[1]],
+                         [c.name for c in channels for n in range(3)])
+        self.assertEqual([text for text, timestamp, channel in results[1]][:3],
+                         ['message 3', 'message 2', 'message 1'])
+
+    def test_refresh_reads_after_checkpoint(self):
+        """Tests that an incremental extraction only reads messages newer than the channel's checkpoint and adds them
+        to a copy of the previous data set"""
+        self.add_previous_data_set('old', [('message 2', 2, 'channel-1')], {1: 2})
+        channels = [FakeChannel(1, [(n, 1) for n in range(1, 6)], self.counter),
+                    FakeChannel(2, [(7, 1)], self.counter)]
+        subject = SimpleNamespace(id=1, name='subject')
+
+        results = self.extract([extract_task.SubjectExtraction(subject, 'old')], channels)
+
+        self.assertEqual(channels[0].reads, [2])
+        self.assertEqual(channels[1].reads, [None])
+        self.assertEqual([text for text, timestamp, channel in results[1]],
+                         ['message 2', 'message 3', 'message 4', 'message 5', 'message 7'])
+        self.assertEqual(self.checkpoints[self.data_sets[1]], {1: 5, 2: 7})
+
+    def test_failed_read_keeps_checkpoint(self):
+        """Tests that a channel whose history can't be read to the end doesn't get a checkpoint past the messages that
+        were missed, and that the next refresh neither misses nor repeats any messages. A read after the checkpoint
+        keeps the messages it got before failing, a full read keeps none."""
+        self.add_previous_data_set('old', [('message 2', 2, 'channel-1')], {1: 2})
+        channels = [FakeChannel(1, [(n, 1) for n in range(1, 6)], self.counter, fail_after=1),
+                    FakeChannel(2, [(n, 1) for n in range(6, 9)], self.counter, fail_after=1)]
+        subject = SimpleNamespace(id=1, name='subject')
+
+        results = self.extract([extract_task.SubjectExtraction(subject, 'old')], channels)
+
+        self.assertEqual([text for text, timestamp, channel in results[1]], ['message 2', 'message 3'])
+        self.assertEqual(self.checkpoints[self.data_sets[1]], {1: 3})
+
+        for channel in channels:
+            channel.fail_after = None
+        results = self.extract([extract_task.SubjectExtraction(subject, self.data_sets[1])], channels)
+
+        self.assertEqual(channels[0].reads, [2, 3])
+        self.assertEqual(channels[1].reads, [None, None])
+        self.assertEqual([text for text, timestamp, channel in results[1]],
+                         ['message 2', 'message 3', 'message 4', 'message 5', 'message 8', 'message 7', 'message 6'])
+        self.assertEqual(self.checkpoints[self.data_sets[1]], {1: 5, 2: 8})
+
+    def test_subjects_with_different_checkpoints(self):
+        """Tests that several subjects are extracted in one read of each channel. The channel is read from the oldest
+        checkpoint, each message goes to its author's data set, and each subject only gets messages newer than their
+        own checkpoint."""
+        self.add_previous_data_set('first', [('message 2', 2, 'channel-1')], {1: 2})
+        self.add_previous_data_set('second', [('message 4', 4, 'channel-1')], {1: 4})
+        channels = [FakeChannel(1, [(1, 1), (2, 1), (3, 1), (4, 2), (5, 1), (6, 2), (7, 3)], self.counter)]
+        first = SimpleNamespace(id=1, name='first')
+        second = SimpleNamespace(id=2, name='second')
+
+        results = self.extract([extract_task.SubjectExtraction(first, 'first'),
+                                extract_task.SubjectExtraction(second, 'second')], channels)
+
+        self.assertEqual(channels[0].reads, [2])
+        self.assertEqual([text for text, timestamp, channel in results[1]], ['message 2', 'message 3', 'message 5'])
+        self.assertEqual([text for text, timestamp, channel in results[2]], ['message 4', 'message 6'])
+        self.assertNotEqual(self.data_sets[1], self.data_sets[2])
+        self.assertEqual(self.checkpoints[self.data_sets[1]], {1: 7})
+        self.assertEqual(self.checkpoints[self.data_sets[2]], {1: 7})
+
+
+class ExtractionCommandsTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+
+        # BigInteger keys don't autoincrement in SQLite
+        self.session.add(Subject(id=1, discord_id=7, trainer_id=100, server_id=1))
+        self.session.add(Subject(id=2, discord_id=8, trainer_id=100, server_id=1))
+        self.session.add(DataSet(id=1, subject_id=1, time_collected=dt.datetime.utcnow(), data_uid='checked'))
+        self.session.add(DataSet(id=2, subject_id=2, time_collected=dt.datetime.utcnow(), data_uid='unchecked'))
+        self.session.add(ChannelCheckpoint(id=1, data_set_id=1, channel_id=5, last_message_id=50))
+        self.session.add(ChannelCheckpoint(id=2, data_set_id=1, channel_id=6, last_message_id=60))
+        self.session.commit()
+
+        self.sent = []
+        self.submitted = []
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def run_command(self, command, *args, **kwargs):
+        async def send(msg):
+            self.sent.append(msg)
+
+        async def submit_extraction(ctx, coroutine):
+            self.submitted.append(coroutine)
+
+        guild = SimpleNamespace(id=1)
+        author = SimpleNamespace(id=100)
+        ctx = SimpleNamespace(author=author, guild=guild, send=send,
+                              message=SimpleNamespace(guild=guild, author=author, channel=SimpleNamespace(send=send)))
+        cog = self.cog = CoreCommands(SimpleNamespace())
+        cog.session = self.session
+        cog.submit_extraction = submit_extraction
+
+        with mock.patch.object(extract_task, 'extract_chat_history', new=lambda *args: args), \
+                mock.patch.object(extract_task, 'extract_chat_histories', new=lambda *args: args), \
+                mock.patch.object(db_queries, 'register_subject'):
+            asyncio.run(command.callback(cog, ctx, *args, **kwargs))
+
+    def test_get_channel_checkpoints(self):
+        self.assertEqual(db_queries.get_channel_checkpoints(self.session, 'checked'), {5: 50, 6: 60})
+        self.assertEqual(db_queries.get_channel_checkpoints(self.session, 'unchecked'), {})
+
+    def test_refresh(self):
+        subject = SimpleNamespace(id=7, name='subject')
+        self.run_command(CoreCommands.refresh, subject=subject)
+        self.assertEqual(len(self.submitted), 1)
+        self.assertEqual(self.submitted[0][1:], (subject, self.cog.bot, 'checked'))
+
+    def test_refresh_without_checkpoints(self):
+        self.run_command(CoreCommands.refresh, subject=SimpleNamespace(id=8, name='subject'))
+        self.assertEqual(self.submitted, [])
+        self.assertIn('can\'t be refreshed', self.sent[-1])
+
+    def test_refresh_without_data_set(self):
+        self.run_command(CoreCommands.refresh, subject=SimpleNamespace(id=9, name='subject'))
+        self.assertEqual(self.submitted, [])
+        self.assertIn('couldn\'t find a data set', self.sent[-1])
+
+    def test_extractmany(self):
+        first = SimpleNamespace(id=7, name='first')
+        second = SimpleNamespace(id=8, name='second')
+        self.run_command(CoreCommands.extractmany, first, second, first)
+
+        self.assertEqual(len(self.submitted), 1)
+        extractions = self.submitted[0][1]
+        self.assertEqual([e.subject for e in extractions], [first, second])
+        self.assertTrue(all(e.previous_data_uid is None for e in extractions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import asyncio
+import tempfile
+import io
+import os
+import json
+from botocore.stub import Stubber
+from botocore.response import StreamingBody
+from cogs import config
+from cogs.lambda_backends import *
+from unittest import mock
+from lambdas.common.dataset import DataSetWriter, data_file_name
+
+MESSAGES = [
+    'the cat sat on the mat',
+    'the dog sat on the log',
+    'a cat and a dog sat together',
+    'the cat ate the fish',
+]
+
+
+def lambda_handler(event, context):
+    """Stands in for a handler, reporting the folder it was given and what was already in it"""
+    folder = event['tmp_folder']
+    found = os.listdir(folder)
+    with open(os.path.join(folder, 'data.dfds'), 'w') as f:
+        f.write(event['data_uid'])
+    return {'tmp_folder': folder, 'found': found}
+
+
+class LocalLambdaBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backend = LocalLambdaBackend(workers=1, store='local', artifact_path=self.folder.name)
+        self.add_data_set('data', MESSAGES)
+
+    def add_data_set(self, data_uid, messages):
+        writer = DataSetWriter()
+        with open(os.path.join(self.folder.name, data_file_name(data_uid)), 'wb') as f:
+            f.write(writer.header() + writer.encode((text, 0, 'general') for text in messages) + writer.footer())
+
+    def tearDown(self):
+        self.backend.shutdown()
+        self.folder.cleanup()
+
+    def test_markovify(self):
+        request = {'data_uid': 'data', 'model_uid': 'model', 'filters': [''], 'state_size': 1, 'new_line': True,
+                   'number_responses': 3}
+        sample_file_name = 'model-sample-responses.txt'
+        response = asyncio.run(self.backend.run(config.lambda_markov_name, request, [sample_file_name]))
+        self.assertEqual(response['model_uid'], 'model')
+        self.assertEqual(len(response['inline'][sample_file_name].split(config.unique_delimiter)), 3)
+        self.assertFalse(os.path.exists(f'./tmp/{sample_file_name}'))
+        self.assertTrue(os.path.exists(os.path.join(self.folder.name, 'model-markov-model.dfmm')))
+
+    def test_large_results_uploaded(self):
+        request = {'data_uid': 'data', 'model_uid': 'model', 'filters': [''], 'state_size': 1, 'new_line': True,
+                   'number_responses': 20000}
+        sample_file_name = 'model-sample-responses.txt'
+        response = asyncio.run(self.backend.run(config.lambda_markov_name, request, [sample_file_name]))
+        try:
+            self.assertNotIn('inline', response)
+            self.assertLess(len(json.dumps(response)), 1000)
+            with open(f'./tmp/{sample_file_name}', encoding='utf-8') as f:
+                self.assertEqual(len(f.read().split(config.unique_delimiter)), 20000)
+        finally:
+            os.remove(f'./tmp/{sample_file_name}')
+
+    def test_dirty_wordcloud(self):
+        """The swear word list has to be found from the bot's working directory"""
+        self.add_data_set('swears', MESSAGES + ['the bloody cat', 'bloody dog', 'oh bugger'])
+        request = {'data_uid': 'swears', 'filters': [''], 'wordcloud_file_name': 'cloud.png', 'dirty': True}
+        response = asyncio.run(self.backend.run(config.lambda_wordcloud_name, request, ['cloud.png', 'cloud.json']))
+        try:
+            self.assertTrue(response['swears'])
+            self.assertTrue(json.loads(response['inline']['cloud.json'])['swears'])
+            self.assertTrue(os.path.exists('./tmp/cloud.png'))
+        finally:
+            if os.path.exists('./tmp/cloud.png'):
+                os.remove('./tmp/cloud.png')
+
+    def test_tmp_folders(self):
+        """Each invocation gets its own temporary folder, which is removed when the handler returns"""
+        with mock.patch.dict(LOCAL_HANDLERS, {'test': __name__}):
+            first = run_handler('test', {'data_uid': 'data'})
+            second = run_handler('test', {'data_uid': 'data'})
+
+        self.assertNotEqual(first['tmp_folder'], second['tmp_folder'])
+        self.assertEqual(second['found'], [])
+        self.assertFalse(os.path.exists(first['tmp_folder']))
+        self.assertFalse(os.path.exists(second['tmp_folder']))
+
+    def test_broken_pool(self):
+        """A worker dying takes the pool down with it, so a new one is started for the next request"""
+        with self.assertRaises(BrokenProcessPool):
+            self.backend.pool.submit(os._exit, 1).result()
+
+        request = {'data_uid': 'data', 'model_uid': 'model', 'filters': [''], 'state_size': 1, 'new_line': True,
+                   'number_responses': 3}
+        self.assertIsNone(asyncio.run(self.backend.run(config.lambda_markov_name, request, [])))
+        response = asyncio.run(self.backend.run(config.lambda_markov_name, request, []))
+        self.assertEqual(response['model_uid'], 'model')
+
+    def test_failure(self):
+        request = {'data_uid': 'missing', 'model_uid': 'model', 'filters': [''], 'state_size': 1, 'new_line': True,
+                   'number_responses': 3}
+        self.assertIsNone(asyncio.run(self.backend.run(config.lambda_markov_name, request, [])))
+
+
+class AwsLambdaBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = AwsLambdaBackend()
+        self.stubber = Stubber(self.backend.lambda_client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def respond(self, payload, **response):
+        body = json.dumps(payload).encode()
+        self.stubber.add_response('invoke', dict(StatusCode=200, Payload=StreamingBody(io.BytesIO(body), len(body)),
+                                                 **response))
+
+    def test_waits_for_response(self):
+        self.respond({'statusCode': 200, 'body': ['hello']})
+        response = asyncio.run(self.backend.run(config.lambda_markov_name, {}, []))
+        self.assertEqual(response['body'], ['hello'])
+
+    def test_function_error(self):
+        self.respond({'errorMessage': 'oops'}, FunctionError='Unhandled')
+        self.assertIsNone(asyncio.run(self.backend.run(config.lambda_markov_name, {}, [])))
+
+
+if __name__ == '__main__':
+    unittest.main()
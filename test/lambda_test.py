@@ -29,9 +29,9 @@ class LambdaTest(unittest.TestCase):
         res_json = json.loads(res_str)
 
         if res_json['statusCode'] == 200:
-            sample_responses = res_json['body']
-            for i in sample_responses:
-                print(i)
+            # Sample responses come back inline when they're small enough
+            for sample_responses in res_json.get('inline', {}).values():
+                print(sample_responses)
 
 
 if __name__ == '__main__':
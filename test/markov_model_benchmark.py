@@ -0,0 +1,111 @@
+"""Compares loading a markov model with markovify.Text.from_json against the compiled format. Each load runs in a fresh
+process so its peak RSS can be measured. Also compares making sentences one at a time against in batches. Run with
+PYTHONPATH=. python test/markov_model_benchmark.py"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import tempfile
+import unittest
+import subprocess
+import markovify
+from lambdas.common import markov_model
+
+SENTENCES = 10**5
+WORDS = 20000
+SAMPLE_SENTENCES = 100
+BATCH_SENTENCES = 1000
+
+
+def make_corpus(rng):
+    words = [f'word{i}' for i in range(WORDS)]
+    weights = [1 / (i + 1) for i in range(WORDS)]
+    return '\n'.join(' '.join(rng.choices(words, weights, k=rng.randint(3, 20))) for i in range(SENTENCES))
+
+
+def peak_rss():
+    """Peak RSS in kB. ru_maxrss carries over from the parent process on Linux so read VmHWM where there is one."""
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def load(kind, file_name):
+    """Loads a model, makes some sentences and prints the timings and peak RSS as json"""
+    start = time.perf_counter()
+    if kind == 'json':
+        with open(file_name) as f:
+            model = markovify.Text.from_json(f.read())
+    else:
+        model = markov_model.CompiledModel.open(file_name)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(SAMPLE_SENTENCES):
+        model.make_sentence(tries=100)
+    sentence_time = time.perf_counter() - start
+
+    print(json.dumps({'load': load_time, 'sentences': sentence_time, 'rss': peak_rss()}))
+
+
+def measure(kind, file_name):
+    output = subprocess.run([sys.executable, __file__, kind, file_name], check=True, capture_output=True,
+                            env=dict(os.environ, PYTHONPATH=os.getcwd())).stdout
+    return json.loads(output)
+
+
+class MarkovModelBenchmark(unittest.TestCase):
+    def test_load(self):
+        text_model = markovify.NewlineText(make_corpus(random.Random(0)), state_size=2)
+        with tempfile.TemporaryDirectory() as folder:
+            json_file_name = f'{folder}/model.json'
+            compiled_file_name = f'{folder}/model.dfmm'
+            with open(json_file_name, 'w') as f:
+                f.write(text_model.to_json())
+            del text_model
+
+            start = time.perf_counter()
+            markov_model.convert_file(json_file_name, compiled_file_name)
+            convert_time = time.perf_counter() - start
+
+            baseline = measure('none', compiled_file_name)
+            print(f'\n{SENTENCES} sentences, converted in {convert_time:.1f}s. Peak RSS after imports: '
+                  f'{baseline["rss"] / 1024:.0f} MB')
+            for kind, file_name in [('json', json_file_name), ('compiled', compiled_file_name)]:
+                result = measure(kind, file_name)
+                print(f'{kind}: {os.path.getsize(file_name) / 2**20:.1f} MB file, loaded in {result["load"]:.3f}s, '
+                      f'{SAMPLE_SENTENCES} sentences in {result["sentences"]:.3f}s, '
+                      f'peak RSS {result["rss"] / 1024:.0f} MB')
+
+    def test_batched_sentences(self):
+        text_model = markovify.NewlineText(make_corpus(random.Random(0)), state_size=2)
+        model = markov_model.CompiledModel(markov_model.compile_text(text_model))
+        del text_model
+
+        start = time.perf_counter()
+        for i in range(BATCH_SENTENCES):
+            model.make_sentence(tries=100)
+        single_time = time.perf_counter() - start
+
+        # The first batch builds the text index
+        timings = []
+        for i in range(2):
+            start = time.perf_counter()
+            model.make_sentences(BATCH_SENTENCES, tries=100)
+            timings.append(time.perf_counter() - start)
+
+        print(f'\n{BATCH_SENTENCES} sentences one at a time: {single_time:.2f}s, in a batch: {timings[0]:.2f}s, '
+              f'with the index built: {timings[1]:.3f}s')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] in ['json', 'compiled']:
+        load(*sys.argv[1:])
+    elif len(sys.argv) == 3:
+        print(json.dumps({'rss': peak_rss()}))
+    else:
+        unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+import random
+import tempfile
+import markovify
+import numpy as np
+from lambdas.common.dataset import DataSetWriter, DataSetReader
+from lambdas.common.message_filter import MessageFilter
+from lambdas.common.markov_model import *
+
+CORPUS = '\n'.join([
+    'the cat sat on the mat',
+    'the dog sat on the log',
+    'a cat and a dog sat together',
+    'the cat ate the fish',
+    'my dog ate my homework',
+    'the fish swam away from the cat',
+])
+
+
+NEW_MESSAGES = [
+    'the bird sat on the fence',
+    'a cat chased the bird',
+    'df!generate',
+]
+
+
+def make_data_set(texts):
+    writer = DataSetWriter()
+    data = writer.header() + writer.encode((text, 0, 'general') for text in texts) + writer.footer()
+    return DataSetReader(data)
+
+
+def train(data_set, filters, text_class=markovify.NewlineText):
+    """Generates a model from scratch the way the markovify lambda does"""
+    matcher = MessageFilter(filters)
+    text_model = text_class('\n'.join(matcher.apply(data_set.texts())), state_size=2)
+    return text_model, compile_text(text_model, training_metadata(data_set, matcher, text_class, 2))
+
+
+def transitions(model):
+    """All of a compiled model's transitions as {state: {next word: weight}}"""
+    result = {}
+    for row, key in enumerate(model.keys):
+        state = []
+        for _ in range(model.state_size):
+            key, token_id = divmod(key, model.base)
+            state.insert(0, model.tokens[token_id])
+        start, end = model.offsets[row], model.offsets[row + 1]
+        weights = [model.cumulative[i] - (model.cumulative[i - 1] if i > start else 0) for i in range(start, end)]
+        result[tuple(state)] = {model.tokens[model.next_ids[i]]: w for i, w in zip(range(start, end), weights)}
+    return result
+
+
+class MarkovModelTest(unittest.TestCase):
+    def setUp(self):
+        self.text_model = markovify.NewlineText(CORPUS, state_size=2)
+
+    def test_same_chain(self):
+        model = CompiledModel(compile_text(self.text_model))
+        self.assertEqual(transitions(model), self.text_model.chain.model)
+
+    def test_convert_json(self):
+        self.assertEqual(convert_json(self.text_model.to_json()), compile_text(self.text_model))
+
+    def test_markovify_compiled_chain(self):
+        self.text_model.chain.compile(inplace=True)
+        model = CompiledModel(compile_model(2, self.text_model.chain.model.items()))
+        self.assertEqual(transitions(model), markovify.NewlineText(CORPUS, state_size=2).chain.model)
+
+    def test_sentences_follow_chain(self):
+        model = CompiledModel(compile_text(self.text_model))
+        random.seed(0)
+        for _ in range(50):
+            words = model.walk()
+            state = (BEGIN, BEGIN)
+            for word in words + [END]:
+                self.assertIn(word, self.text_model.chain.model[state])
+                state = (state[1], word)
+
+    def test_init_state(self):
+        model = CompiledModel(compile_text(self.text_model))
+        sentence = model.make_sentence(init_state=('the', 'fish'), test_output=False)
+        self.assertEqual(sentence.split(' ')[:2], ['the', 'fish'])
+        with self.assertRaises(KeyError):
+            model.walk(('no', 'such'))
+
+    def test_rejects_copies(self):
+        model = CompiledModel(compile_text(markovify.Text('Only one sentence here.')))
+        self.assertIsNone(model.make_sentence())
+        self.assertEqual(model.make_sentence(test_output=False), 'Only one sentence here.')
+
+    def test_batched_sentences_follow_chain(self):
+        model = CompiledModel(compile_text(self.text_model))
+        chain = self.text_model.chain.model
+        sentences = model.make_sentences(50, test_output=False, random_state=np.random.RandomState(0))
+        self.assertEqual(len(sentences), 50)
+        for sentence in sentences:
+            state = (BEGIN, BEGIN)
+            for word in sentence.split(' ') + [END]:
+                self.assertIn(word, chain[state])
+                state = (state[1], word)
+
+    def test_batched_init_state(self):
+        model = CompiledModel(compile_text(self.text_model))
+        for sentence in model.make_sentences(20, init_state=('the', 'cat'), test_output=False):
+            self.assertEqual(sentence.split(' ')[:2], ['the', 'cat'])
+        with self.assertRaises(KeyError):
+            model.make_sentences(1, init_state=('the', 'unicorn'))
+
+    def test_batched_rejects_copies(self):
+        model = CompiledModel(compile_text(self.text_model))
+        original = set(CORPUS.split('\n'))
+        for sentence in model.make_sentences(50, tries=20, random_state=np.random.RandomState(1)):
+            self.assertNotIn(sentence, original)
+
+    def test_batched_sentences_longer_than_text(self):
+        model = CompiledModel(compile_text(markovify.NewlineText('a a', state_size=1)))
+        sentences = model.make_sentences(20, tries=5, random_state=np.random.RandomState(0))
+        self.assertTrue(any(sentence is not None and len(sentence.split(' ')) > 2 for sentence in sentences))
+
+    def test_copies_text_matches_search(self):
+        model = CompiledModel(compile_text(self.text_model))
+        random.seed(2)
+        sentences = [model.make_sentence(test_output=False).split(' ') for _ in range(200)]
+        copied = model.copies_text([np.array([model.token_id(word) for word in words]) for words in sentences])
+        self.assertEqual(list(copied), [not model.test_sentence_output(words, DEFAULT_MAX_OVERLAP_RATIO,
+                                                                       DEFAULT_MAX_OVERLAP_TOTAL)
+                                        for words in sentences])
+
+    def test_memory_map(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(compile_text(self.text_model))
+            f.flush()
+            model = CompiledModel.open(f.name)
+            self.assertEqual(transitions(model), self.text_model.chain.model)
+            self.assertIsNotNone(model.make_sentence(tries=100, test_output=False))
+            model.close()
+
+    def test_update_with_new_messages(self):
+        old_data_set = make_data_set(CORPUS.split('\n'))
+        new_data_set = make_data_set(CORPUS.split('\n') + NEW_MESSAGES)
+        _, previous = train(old_data_set, ['df!'])
+        expected, _ = train(new_data_set, ['df!'])
+
+        model = CompiledModel(update_model(CompiledModel(previous), new_data_set, MessageFilter(['df!']),
+                                           markovify.NewlineText, 2))
+        self.assertEqual(model.chain(), expected.chain.model)
+        self.assertEqual(model.sentences(), expected.parsed_sentences)
+        self.assertEqual(model.metadata['messages'], len(new_data_set))
+        self.assertIsNotNone(model.make_sentence(tries=100, test_output=False))
+
+    def test_update_with_changed_filters(self):
+        data_set = make_data_set(CORPUS.split('\n') * 3 + NEW_MESSAGES)
+        _, previous = train(data_set, ['homework', 'df!'])
+        expected, _ = train(data_set, ['fish', 'df!'])
+
+        model = CompiledModel(update_model(CompiledModel(previous), data_set, MessageFilter(['fish', 'df!']),
+                                           markovify.NewlineText, 2))
+        self.assertEqual(model.chain(), expected.chain.model)
+        self.assertEqual(sorted(model.sentences()), sorted(expected.parsed_sentences))
+
+    def test_rebuild_needed(self):
+        corpus = CORPUS.split('\n') * 3
+        data_set = make_data_set(corpus + NEW_MESSAGES)
+        _, previous = train(make_data_set(corpus), [])
+        _, previous_text = train(make_data_set(corpus), [], markovify.Text)
+        previous, previous_text = CompiledModel(previous), CompiledModel(previous_text)
+
+        # Different settings, a data set that doesn't start with the old one and a model that doesn't split on new
+        # lines, whose sentences can run from one message into the next
+        self.assertIsNone(update_model(previous, data_set, MessageFilter([]), markovify.NewlineText, 3))
+        self.assertIsNone(update_model(previous, data_set, MessageFilter([]), markovify.Text, 2))
+        self.assertIsNone(update_model(previous, make_data_set(NEW_MESSAGES + corpus), MessageFilter([]),
+                                       markovify.NewlineText, 2))
+        self.assertIsNone(update_model(previous_text, data_set, MessageFilter(['cat']), markovify.Text, 2))
+        self.assertIsNone(update_model(previous_text, data_set, MessageFilter([]), markovify.Text, 2))
+        self.assertIsNotNone(update_model(previous, data_set, MessageFilter([]), markovify.NewlineText, 2))
+
+    def test_remove_transitions(self):
+        model = CompiledModel(compile_text(markovify.NewlineText('a b\na c', state_size=2)))
+        model = CompiledModel(update_compiled(model, [], [['a', 'b']]))
+        self.assertEqual(model.chain(), transitions(CompiledModel(compile_text(markovify.NewlineText('a c', 2)))))
+        self.assertEqual(model.sentences(), [['a', 'c']])
+        with self.assertRaises(ValueError):
+            update_compiled(model, [], [['a', 'b']])
+
+    def test_new_words_outgrow_base(self):
+        model = CompiledModel(compile_text(markovify.NewlineText('a b', state_size=2)))
+        self.assertIsNone(update_compiled(model, [['c', 'd', 'e', 'f', 'g']], []))
+
+    def test_to_json(self):
+        model = markovify.NewlineText.from_json(to_json(CompiledModel(compile_text(self.text_model))))
+        self.assertEqual(model.chain.model, self.text_model.chain.model)
+        self.assertEqual(model.parsed_sentences, self.text_model.parsed_sentences)
+
+    def test_not_a_model(self):
+        with self.assertRaises(ValueError):
+            CompiledModel(b'{"state_size": 2}' * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
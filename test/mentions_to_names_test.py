@@ -0,0 +1,63 @@
+import unittest
+from types import SimpleNamespace
+from cogs.extract_task_functions import *
+
+
+class FakeBot:
+    """Stands in for the Discord client's user cache"""
+    def __init__(self, users):
+        self.users = {u.id: u for u in users}
+        self.lookups = 0
+
+    def get_user(self, discord_id):
+        self.lookups += 1
+        return self.users.get(discord_id)
+
+
+class MentionsToNamesTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = FakeBot([SimpleNamespace(id=1234, name='Rusty', discriminator='0000')])
+
+    def test_user_mention(self):
+        s = 'hi <@1234>'
+        self.assertEqual(mentions_to_names(s, self.bot, MemberNameCache()), 'hi @Rusty#0000')
+
+    def test_nickname_mention(self):
+        s = '<@!1234> and <@!1234>'
+        self.assertEqual(mentions_to_names(s, self.bot, MemberNameCache()), '@Rusty#0000 and @Rusty#0000')
+
+    def test_unknown_user(self):
+        s = 'hi <@5678>'
+        self.assertEqual(mentions_to_names(s, self.bot, MemberNameCache()), 'hi @UNKNOWN_USER')
+
+    def test_names_are_cached(self):
+        names = MemberNameCache()
+        for i in range(10):
+            mentions_to_names('<@1234>', self.bot, names)
+        self.assertEqual(self.bot.lookups, 1)
+
+    def test_least_recently_used_evicted(self):
+        names = MemberNameCache(max_size=2)
+        names.get(1, self.bot)
+        names.get(2, self.bot)
+        names.get(1, self.bot)
+        names.get(3, self.bot)
+        self.assertEqual(list(names.names.keys()), [1, 3])
+
+    def test_role_mention(self):
+        s = '<@&1234>!'
+        self.assertEqual(mentions_to_names(s, self.bot, MemberNameCache()), '@Rusty#0000!')
+
+    def test_not_a_mention(self):
+        s = 'email me <@> or <@abc>'
+        self.assertEqual(mentions_to_names(s, self.bot, MemberNameCache()), s)
+
+    def test_batch(self):
+        messages = ['hello', '<@1234> hi', 'bye <@!5678>'] * 10**5
+        expected_result = ['hello', '@Rusty#0000 hi', 'bye @UNKNOWN_USER'] * 10**5
+        self.assertEqual(mentions_to_names_batch(messages, self.bot, MemberNameCache()), expected_result)
+        self.assertEqual(self.bot.lookups, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Compares the lambdas' old nested filter loop with MessageFilter for thousands of filters over a million messages.
+The nested loop only runs over the first NESTED_LOOP_MESSAGES messages and its time is scaled up, otherwise it takes
+several minutes. Run with PYTHONPATH=. python test/message_filter_benchmark.py"""
+import time
+import random
+import string
+import unittest
+from lambdas.common.message_filter import *
+
+MESSAGES = 10**6
+NESTED_LOOP_MESSAGES = 2 * 10**4
+FILTERS = [10, 100, 1000, 5000]
+
+
+def random_word(rng, shortest, longest):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(shortest, longest)))
+
+
+def nested_loop(content, filters):
+    filtered_content = []
+    for i in content:
+        include = True
+        for j in filters:
+            if j in i:
+                include = False
+                break
+        if include:
+            filtered_content.append(i)
+    return filtered_content
+
+
+class MessageFilterBenchmark(unittest.TestCase):
+    def test_filters(self):
+        rng = random.Random(0)
+        words = [random_word(rng, 2, 9) for i in range(5000)]
+        content = [' '.join(rng.choices(words, k=rng.randint(1, 15))) for i in range(MESSAGES)]
+
+        print(f'\n{MESSAGES} messages')
+        for n in FILTERS:
+            filters = [random_word(rng, 4, 8) for i in range(n)]
+
+            start = time.perf_counter()
+            expected = nested_loop(content[:NESTED_LOOP_MESSAGES], filters)
+            nested_loop_time = (time.perf_counter() - start) * MESSAGES / NESTED_LOOP_MESSAGES
+
+            start = time.perf_counter()
+            matcher = MessageFilter(filters)
+            compile_time = time.perf_counter() - start
+            filtered_content = list(matcher.apply(content))
+            filter_time = time.perf_counter() - start
+
+            self.assertEqual(filtered_content[:len(expected)], expected)
+            print(f'{n} filters: nested loop ~{nested_loop_time:.1f}s, '
+                  f'MessageFilter {filter_time:.1f}s ({compile_time:.3f}s to compile)')
+
+
+if __name__ == '__main__':
+    unittest.main()
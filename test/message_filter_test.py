@@ -0,0 +1,52 @@
+import unittest
+from lambdas.common.message_filter import *
+
+
+def nested_loop(content, filters):
+    """How the lambdas applied filters before MessageFilter"""
+    filtered_content = []
+    for i in content:
+        include = True
+        for j in filters:
+            if j in i:
+                include = False
+                break
+        if include:
+            filtered_content.append(i)
+    return filtered_content
+
+
+class MessageFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.content = ['df!generate', 'hello there', 'she sells sea shells', 'hershey', 'ushers', 'his', '', 'ĉu vi?']
+
+    def test_no_filters(self):
+        self.assertEqual(list(MessageFilter(['']).apply(self.content)), self.content)
+        self.assertEqual(list(MessageFilter([]).apply(self.content)), self.content)
+
+    def test_few_filters(self):
+        filters = ['df!', 'she']
+        self.assertEqual(list(MessageFilter(filters).apply(self.content)), nested_loop(self.content, filters))
+
+    def test_automaton(self):
+        filters = ['he', 'she', 'his', 'hers', 'ĉu'] + [f'unused{i}' for i in range(MIN_AUTOMATON_FILTERS)]
+        matcher = MessageFilter(filters)
+        self.assertIsNotNone(matcher.goto)
+        self.assertEqual(list(matcher.apply(self.content)), nested_loop(self.content, filters))
+
+    def test_counts(self):
+        for filters in [[''], ['she'], ['she'] + [f'unused{i}' for i in range(MIN_AUTOMATON_FILTERS)]]:
+            matcher = MessageFilter(filters)
+            kept = list(matcher.apply(iter(self.content)))
+            self.assertEqual((matcher.checked, matcher.kept), (len(self.content), len(kept)))
+
+    def test_suffix_matches(self):
+        # 'ushers' only contains 'she' and 'hers' part way through a longer trie path
+        filters = ['usha', 'hers'] + [f'unused{i}' for i in range(MIN_AUTOMATON_FILTERS)]
+        matcher = MessageFilter(filters)
+        self.assertTrue(matcher.matches('ushers'))
+        self.assertFalse(matcher.matches('usher'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import asyncio
+import tempfile
+import datetime as dt
+import markovify
+from types import SimpleNamespace
+from unittest import mock
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from cogs.db_schema import *
+from cogs import db_queries
+from cogs import model_cache
+from cogs.model_commands import ModelCommands
+from cogs.object_store import LocalObjectStore
+from cogs.model_cache import *
+from lambdas.common.markov_model import compile_text, model_file_name
+
+
+class ModelCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        self.session.add(Subject(id=1, discord_id=7, trainer_id=100, server_id=1))
+        self.session.add(DataSet(id=1, subject_id=1, time_collected=dt.datetime.utcnow(), data_uid='data'))
+        self.session.commit()
+
+    def add_model(self, model_id, model_uid, cache_key, age=0):
+        # BigInteger keys don't autoincrement in SQLite
+        time_collected = dt.datetime.utcnow() - dt.timedelta(days=age)
+        self.session.add(MarkovModel(id=model_id, data_set_id=1, model_uid=model_uid, cache_key=cache_key,
+                                     time_collected=time_collected, time_used=time_collected))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_cache_key(self):
+        key = model_cache_key('data', ['cat', 'dog'], 2, True)
+        self.assertEqual(key, model_cache_key('data', ['dog', 'cat', 'cat', ''], 2, True))
+        self.assertNotEqual(key, model_cache_key('other', ['cat', 'dog'], 2, True))
+        self.assertNotEqual(key, model_cache_key('data', ['cat'], 2, True))
+        self.assertNotEqual(key, model_cache_key('data', ['cat', 'dog'], 3, True))
+        self.assertNotEqual(key, model_cache_key('data', ['cat', 'dog'], 2, False))
+
+    def test_find_and_evict(self):
+        key = model_cache_key('data', [], 2, True)
+        self.assertIsNone(db_queries.find_cached_markov_model(self.session, key))
+
+        self.add_model(1, 'old', key)
+        self.add_model(2, 'new', key)
+        self.assertEqual(db_queries.find_cached_markov_model(self.session, key), 'new')
+
+        db_queries.evict_cached_markov_model(self.session, 'new')
+        self.assertEqual(db_queries.find_cached_markov_model(self.session, key), 'old')
+
+    def test_expired(self):
+        key = model_cache_key('data', [], 2, True)
+        self.add_model(1, 'old', key, age=31)
+
+        self.assertIsNone(db_queries.find_cached_markov_model(self.session, key))
+        self.assertIsNone(self.session.query(MarkovModel).first().cache_key)
+
+    def test_deploy_after_cache_hit(self):
+        """Tests that a model reused from the cache becomes the subject's latest model, which is the one deployed, and
+        that it isn't reported as expired"""
+        key = model_cache_key('data', [], 2, True)
+        self.add_model(1, 'cached', key, age=29)
+        self.add_model(2, 'other', None, age=1)
+
+        sent = []
+
+        async def send(msg):
+            sent.append(msg)
+
+        subject = SimpleNamespace(id=7, name='subject')
+        guild = SimpleNamespace(id=1)
+        ctx = SimpleNamespace(message=SimpleNamespace(guild=guild, author=SimpleNamespace(id=100),
+                                                      channel=SimpleNamespace(send=send)))
+        parent_cog = SimpleNamespace(session=self.session)
+        with mock.patch('cogs.lambda_backends.get_lambda_backend'):
+            cog = ModelCommands(SimpleNamespace(get_cog=lambda name: parent_cog))
+
+        async def deploy():
+            with mock.patch.object(model_cache, 'generate_responses', return_value=['hello']):
+                self.assertTrue(await cog.cached_markovify(ctx, subject, key))
+            return await db_queries.get_latest_markov_model(self.session, ctx, subject)
+
+        self.assertEqual(asyncio.run(deploy()), 'cached')
+        self.assertFalse(any('expired' in msg for msg in sent))
+
+    def test_generate_responses(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalObjectStore(root)
+            self.assertIsNone(generate_responses(store, 'model', 3))
+
+            text_model = markovify.NewlineText('the cat sat on the mat\nthe dog sat on the log', state_size=1)
+            with open(store.path(model_file_name('model')), 'wb') as f:
+                f.write(compile_text(text_model))
+            responses = generate_responses(store, 'model', 3)
+            self.assertEqual(len(responses), 3)
+            self.assertTrue(all(isinstance(r, str) for r in responses))
+
+    def test_upgrade_tables(self):
+        """Tests adding the cache columns to a database made before they existed"""
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE markov_models (id BIGINT PRIMARY KEY, data_set_id BIGINT, '
+                              'time_collected DATETIME, model_uid VARCHAR(32))'))
+            conn.execute(text("INSERT INTO markov_models (id, model_uid) VALUES (1, 'old')"))
+
+        db_queries.upgrade_tables(engine)
+        db_queries.upgrade_tables(engine)
+
+        inspector = inspect(engine)
+        self.assertIn('cache_key', [c['name'] for c in inspector.get_columns('markov_models')])
+        self.assertIn('time_used', [c['name'] for c in inspector.get_columns('markov_models')])
+        self.assertIn('ix_markov_models_cache_key', [i['name'] for i in inspector.get_indexes('markov_models')])
+        self.assertIn('channel_checkpoints', inspector.get_table_names())
+
+        session = Session(engine)
+        self.assertIsNone(db_queries.find_cached_markov_model(session, 'key'))
+        session.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import asyncio
+import tempfile
+import os
+from cogs.object_store import *
+
+
+class StreamingUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = LocalObjectStore(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def upload(self, key, chunks, part_size=MIN_PART_SIZE):
+        async def run():
+            upload = StreamingUpload(self.store, key, part_size)
+            await upload.start()
+            for chunk in chunks:
+                await upload.write(chunk)
+            await upload.close()
+            return upload
+
+        return asyncio.run(run())
+
+    def test_single_part(self):
+        self.upload('small', [b'hello ', b'world'])
+        self.assertEqual(read_object(self.store, 'small'), b'hello world')
+
+    def test_many_parts(self):
+        chunks = [os.urandom(1000) for i in range(100)]
+        upload = self.upload('big', chunks, part_size=10**4)
+        self.assertGreater(len(upload.parts), 5)
+        self.assertEqual(read_object(self.store, 'big'), b''.join(chunks))
+        self.assertEqual(os.listdir(self.folder.name), ['big'])
+
+    def test_empty(self):
+        self.upload('empty', [])
+        self.assertEqual(read_object(self.store, 'empty'), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
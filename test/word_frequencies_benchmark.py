@@ -0,0 +1,79 @@
+"""Compares the word cloud lambda's old word and swear word counting with lambdas/common/word_frequencies.py over a
+million messages. The old swear word count only runs over the first OLD_SWEAR_MESSAGES messages and its time is scaled
+up. Run with PYTHONPATH=. python test/word_frequencies_benchmark.py"""
+import time
+import random
+import string
+import unittest
+import multidict
+from wordcloud import STOPWORDS
+from lambdas.common.word_frequencies import *
+from lambdas.wordcloud.lambda_wordcloud import count_swears, load_swear_words, SWEAR_WORDS_PATH
+
+MESSAGES = 10**6
+OLD_SWEAR_MESSAGES = 10**5
+
+
+def random_word(rng, shortest, longest):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(shortest, longest)))
+
+
+def old_frequency_dict(sentences):
+    full_terms_dict = multidict.MultiDict()
+    tmp_dict = {}
+    for sentence in sentences:
+        for text in sentence.split(" "):
+            if text.lower().strip() in STOPWORDS:
+                continue
+            val = tmp_dict.get(text, 0)
+            tmp_dict[text.strip()] = val + 1
+    for key in tmp_dict:
+        full_terms_dict.add(key, tmp_dict[key])
+    return full_terms_dict
+
+
+def old_swear_count(content, swear_words):
+    content = ' '.join(content)
+    bad_language = ''
+    for s in swear_words:
+        bad_language = bad_language + (s + ' ') * content.lower().count(' ' + s + ' ')
+    return old_frequency_dict([bad_language])
+
+
+class WordFrequenciesBenchmark(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(0)
+        with open(SWEAR_WORDS_PATH) as f:
+            cls.swear_words = [line.strip() for line in f]
+        words = [random_word(rng, 2, 9) for i in range(20000)] + list(STOPWORDS) * 20 + cls.swear_words * 5
+        cls.content = [' '.join(rng.choices(words, k=rng.randint(1, 15))) for i in range(MESSAGES)]
+        print(f'\n{MESSAGES} messages')
+
+    def test_word_frequencies(self):
+        start = time.perf_counter()
+        old_frequency_dict(self.content)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        frequencies = word_frequencies(iter(self.content), stopwords=STOPWORDS)
+        new_time = time.perf_counter() - start
+
+        self.assertEqual(len(frequencies), MAX_WORDS)
+        print(f'Word frequencies: get_frequency_dict {old_time:.2f}s, word_frequencies {new_time:.2f}s')
+
+    def test_swear_words(self):
+        start = time.perf_counter()
+        old_swear_count(self.content[:OLD_SWEAR_MESSAGES], self.swear_words)
+        old_time = (time.perf_counter() - start) * MESSAGES / OLD_SWEAR_MESSAGES
+
+        start = time.perf_counter()
+        counts = count_swears(iter(self.content), *load_swear_words())
+        new_time = time.perf_counter() - start
+
+        self.assertTrue(counts)
+        print(f'Swear words: old count ~{old_time:.2f}s, count_swears {new_time:.2f}s')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from lambdas.common.word_frequencies import *
+
+
+class WordFrequenciesTest(unittest.TestCase):
+    def test_count_words(self):
+        """Tests that words are split on any whitespace and counted under the word itself"""
+        counts = count_words(iter(['a  b\ta', ' b\n', '', 'A']))
+        self.assertEqual(counts, {'a': 2, 'b': 2, 'A': 1})
+        self.assertEqual(count_words(['A a'], lower=True), {'a': 2})
+        self.assertEqual(count_words(['a b c a'], vocabulary={'a', 'c'}), {'a': 2, 'c': 1})
+
+    def test_read_chunks(self):
+        """Tests joining texts into chunks, including texts that are empty"""
+        self.assertEqual(list(read_chunks(['', '', 'A', 'b'], lower=True, size=2)), ['\n', 'a\nb'])
+        self.assertEqual(list(read_chunks([])), [])
+
+    def test_top_words(self):
+        """Tests stopword removal, vocabulary and pruning to the most common words"""
+        counts = count_words(['the cat The dog cat cat dog bird'])
+        self.assertEqual(top_words(counts, stopwords={'the'}), {'cat': 3, 'dog': 2, 'bird': 1})
+        self.assertEqual(top_words(counts, max_words=2, stopwords={'the'}), {'cat': 3, 'dog': 2})
+
+    def test_word_frequencies(self):
+        """Tests counting and pruning a stream of messages in one call"""
+        texts = (f'word{i % 300} word{i % 7}' for i in range(3000))
+        frequencies = word_frequencies(texts, max_words=5)
+        self.assertEqual(len(frequencies), 5)
+        self.assertEqual(frequencies['word0'], 10 + 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
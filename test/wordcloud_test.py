@@ -0,0 +1,30 @@
+import os
+import unittest
+import tempfile
+from lambdas.wordcloud.lambda_wordcloud import *
+
+
+class SwearCountTest(unittest.TestCase):
+    def test_count_swears(self):
+        """Tests that swear words are counted once per word, whatever their case"""
+        words = frozenset(['darn', 'heck'])
+        phrases = ['gosh darn it']
+        content = iter(['Darn it, what the heck', 'HECK heck', 'darned', 'gosh darn it all', 'nothing here',
+                        'gosh darn it'])
+        counts = count_swears(content, words, phrases)
+        self.assertEqual(counts, {'darn': 3, 'heck': 3, 'gosh darn it': 2})
+        self.assertEqual(count_swears(['clean'], words), {})
+
+    def test_load_swear_words(self):
+        """Tests reading the swear word list"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'swear-words.txt')
+            with open(path, 'w') as f:
+                f.write('Darn\nheck \ngosh darn it\n\n')
+            words, phrases = load_swear_words(path)
+        self.assertEqual(words, {'darn', 'heck'})
+        self.assertEqual(phrases, ['gosh darn it'])
+
+
+if __name__ == '__main__':
+    unittest.main()